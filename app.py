@@ -1,22 +1,206 @@
 import os
-import logging
-import re
-import openpyxl
-from enums import CMSPathTypes, CMSSubmissionsFileExcelColumns, CMSTools
+import time
+from enums import CMSPathTypes, CMSSubmissionsFileExcelColumns, CMSTools, CMSUploadOutcomes, CMSCompareModes
 from path_finder import PathFinder
-from map_path_builder import MapPathBuilder
-import shutil
-from constants import DRIVE_LETTER, CMS_FOLDER
-from rich.console import Console
-from rich.prompt import Prompt
+from map_path_builder import MapPathBuilder, FILE_NUMBER_PATTERN
+from directory_cache import DirectoryCache
+from cms_index import CMSIndex
+from copy_engine import CopyEngine
+from copy_plan import CopyPlan
+from transfer_controller import TransferController, ShareUnavailableError
+from upload_journal import UploadJournal
+from file_copier import FileCopier, DEFAULT_BUFFER_SIZE
+from hash_cache import HashCache
+from instrumentation import RunInstrumentation
+from run_logger import RunLogger
+from workbook_io import read_header, has_columns, iter_rows, iter_chunks, results_file_path, ResultWriter
+from concurrent.futures import ThreadPoolExecutor
+from constants import DRIVE_LETTER, CMS_FOLDER, VPN_CHECK_PATH, STREAMING_CHUNK_SIZE, MTIME_TOLERANCE_SECONDS, \
+    HASH_CACHE_FILE_NAME, PATH_BUILDER_REPORT_FILE_NAME, BULK_UPLOADER_REPORT_FILE_NAME, PIPELINE_QUEUE_SIZE, \
+    PIPELINE_READ_CHUNK_SIZE, PIPELINE_LOG_FILE_NAME, BULK_UPLOADER_LOG_FILE_NAME, PROGRESS_REFRESH_SECONDS, \
+    RETRY_MAX_ATTEMPTS, RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS, SHARE_PAUSE_TIMEOUT_SECONDS, \
+    SHARE_POLL_SECONDS, POST_LICENCE_FOLDER_NAME
+
+
+def _resolve_row(submission, path_type: str, path_builder: MapPathBuilder, path_finder: PathFinder,
+                 cms_index: CMSIndex = None) -> str or None:
+    """
+    Resolve the Destination value for a row of the submissions file.
+
+    :param submission: The value of the row's Submission column.
+    :param path_type: The type of CMS path to find.
+    :param path_builder: The path builder used to build the path.
+    :param path_finder: The path finder used to search the range path of the Product types.
+    :param cms_index: (Optional) The index the path finder reads from, used to verify paths on hit.
+
+    :return: The found path, an empty string if the range folder doesn't exist, or None if the row doesn't contain
+        the numbers the path type needs.
+    """
+    try:
+        path = path_builder.build_path(path_type, submission, path_finder)
+        # Make sure a path served from the index still exists - Search the live folders again if it doesn't
+        if path is not None and cms_index is not None and cms_index.verify_on_hit and not cms_index.verify(path):
+            path_finder.directory_cache.invalidate(path)
+            path = path_builder.build_path(path_type, submission, path_finder)
+        return path
+
+    except FileNotFoundError:
+        return ""
 
 
-def handle_cms_path_builder(submissions_file_path: str, path_type: str) -> str:
+def _valid_destinations(submissions: list, destinations: list, path_type: str, path_builder: MapPathBuilder,
+                        directory_cache: DirectoryCache, cms_index: CMSIndex = None, max_workers: int = 1) -> list:
+    """
+    Check which Product rows already have a Destination that is still valid and doesn't need to be resolved again.
+
+    A Destination is valid if it is under the range folder of the row's file number, the numbers in it below the range
+    folder are the ones the path type is built from, it is a Post Licence folder only for that path type and it is
+    still a folder in the CMS. The rows are grouped by the parent folder of their Destination,
+    so a parent shared by several rows is listed once for all of them instead of checking every Destination on the
+    share. With an index, every parent is read through the index, which only checks its mtime on the share.
+
+    :param submissions: The values of the Submission column.
+    :param destinations: The values of the Destination column.
+    :param path_type: The Product CMSPathTypes value the Destinations should have been resolved for.
+    :param path_builder: The path builder used to build the range paths.
+    :param directory_cache: The directory listing cache used to list the parent folders.
+    :param cms_index: (Optional) The index the directory cache reads from.
+    :param max_workers: The number of parent folders to list at the same time.
+
+    :return: A list of booleans in the same order as the submissions, True for the rows whose Destination is valid.
+    """
+    post_licence = path_type == CMSPathTypes.PRODUCT_POST_LICENCE_FOLDER.value
+    groups = {}
+    for index, (submission, destination) in enumerate(zip(submissions, destinations)):
+        matches = FILE_NUMBER_PATTERN.findall(str(submission).lower())
+        if not matches or len(matches) > 2 or not isinstance(destination, str) or not destination:
+            continue
+        destination = os.path.normpath(destination)
+        range_path = os.path.normcase(os.path.normpath(path_builder.build_product_path(matches[0])))
+        if not os.path.normcase(destination).startswith(range_path + os.sep):
+            continue
+        # The Post Licence folder is only looked up by file number
+        numbers = {matches[0]} if post_licence else set(matches)
+        # An edited Submission value or a Destination resolved for another path type no longer matches, such as a
+        # submission folder for a row with only a file number
+        if set(FILE_NUMBER_PATTERN.findall(destination[len(range_path):].lower())) != numbers or \
+                (POST_LICENCE_FOLDER_NAME.lower() in os.path.basename(destination).lower()) != post_licence:
+            continue
+        groups.setdefault(os.path.dirname(destination), []).append((index, destination))
+
+    valid = [False] * len(submissions)
+
+    def check_group(parent, rows):
+        # A single row is cheaper to check on its own than by listing its parent, unless the listing is indexed
+        if len(rows) > 1 or cms_index is not None:
+            try:
+                directory_cache.list_dir(parent)
+            except OSError:
+                return
+        for index, destination in rows:
+            valid[index] = directory_cache.is_dir(destination)
+
+    if max_workers <= 1:
+        for parent, rows in groups.items():
+            check_group(parent, rows)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(check_group, parent, rows) for parent, rows in groups.items()]:
+                future.result()
+    return valid
+
+
+def _resolve_rows(submissions: list, path_type: str, path_builder: MapPathBuilder, path_finder: PathFinder,
+                  cms_index: CMSIndex = None, max_workers: int = 1, instrumentation: RunInstrumentation = None,
+                  first_row_number: int = 2, destinations: list = None) -> list:
+    """
+    Resolve the Destination values for the rows of the submissions file.
+
+    Rows are grouped by the range folder of their file number and the groups are resolved concurrently, so each range
+    folder is listed once and the rows in it are served from the directory cache.
+
+    :param submissions: The values of the Submission column.
+    :param path_type: The type of CMS path to find.
+    :param path_builder: The path builder used to build the range paths.
+    :param path_finder: The path finder used to search the range paths.
+    :param cms_index: (Optional) The index the path finder reads from, used to verify paths on hit.
+    :param max_workers: The number of range folders to resolve at the same time.
+    :param instrumentation: (Optional) The run instrumentation to time each row with.
+    :param first_row_number: The row number in the Excel file of the first submission.
+    :param destinations: (Optional) The current values of the Destination column. Product rows whose Destination is
+        still valid keep it and aren't resolved again. The other path types don't search the share, so they are always
+        built again.
+
+    :return: The resolved values in the same order as the submissions.
+    """
+    # The other path types are built from the Submission values alone, without looking at the share
+    if path_type not in CMSPathTypes.get_product_values():
+        if instrumentation is None:
+            instrumentation = RunInstrumentation(enabled=False)
+        with instrumentation.timed("MapPathBuilder.build_paths"):
+            return path_builder.build_paths(path_type, submissions, path_finder)
+
+    if instrumentation is None:
+        instrumentation = RunInstrumentation(enabled=False)
+
+    paths = [None] * len(submissions)
+    valid = [False] * len(submissions)
+    if destinations is not None:
+        valid = _valid_destinations(submissions, destinations, path_type, path_builder, path_finder.directory_cache,
+                                    cms_index, max_workers)
+
+    groups = {}
+    for index, submission in enumerate(submissions):
+        if valid[index]:
+            paths[index] = destinations[index]
+            continue
+        matches = FILE_NUMBER_PATTERN.findall(str(submission).lower())
+        range_path = path_builder.build_product_path(str(matches[0])) if matches else None
+        groups.setdefault(range_path, []).append(index)
+
+    def resolve_group(indexes):
+        for index in indexes:
+            with instrumentation.row(first_row_number + index, submissions[index]):
+                paths[index] = _resolve_row(submissions[index], path_type, path_builder, path_finder, cms_index)
+
+    if max_workers <= 1:
+        for indexes in groups.values():
+            resolve_group(indexes)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(resolve_group, indexes) for indexes in groups.values()]:
+                future.result()
+    return paths
+
+
+def handle_cms_path_builder(submissions_file_path: str, path_type: str, directory_cache: DirectoryCache = None,
+                            index_file_path: str = None, verify_on_hit: bool = False, max_workers: int = 1,
+                            streaming: bool = False, output_file_path: str = None, instrument: bool = False,
+                            report_file_path: str = None, incremental: bool = False) -> str:
     """
    Handle building CMS (Content Management System) paths based on the provided submissions file and path type.
 
    :param submissions_file_path: The path to the Excel file containing submission information.
-   :param path_type: The type of CMS path to build.
+   :param path_type: The type of CMS path to build. The Product types are searched for on the share, the other types
+       are built from the company code and file number in the Submission column.
+   :param directory_cache: (Optional) The directory listing cache to use for the run. A new one is created if none is
+       given. It can't be combined with an index file, since its listings weren't read from the index.
+   :param index_file_path: (Optional) The path of a CMSIndex file to read directory listings from instead of the share.
+       Only the mtime of an indexed folder is checked on the share, and the folder is listed again if it changed.
+   :param verify_on_hit: A boolean indicating whether paths resolved from the index should be checked against the
+       share before they are written to the Destination column.
+   :param max_workers: The number of range folders to resolve at the same time.
+   :param streaming: A boolean indicating whether to stream the rows from a read-only workbook and write the results to
+       a side file instead of saving them into the submissions file.
+   :param output_file_path: (Optional) The .xlsx or .csv file to write the streamed results to. Default is a
+       "_results.xlsx" file next to the submissions file.
+   :param instrument: A boolean indicating whether to count and time the file system calls and rows of the run and
+       report a summary at the end.
+   :param report_file_path: (Optional) The JSON file to write the instrumentation report to. Default is
+       pathBuilderReport.json in the working directory.
+   :param incremental: A boolean indicating whether to keep the Destination of Product rows that already have a valid
+       one and only resolve the new, blank and stale rows, so re-running a sheet with a few new rows only searches the
+       CMS for those rows.
 
    :return: A string indicating the outcome of building CMS paths.
        Possible return values:
@@ -25,15 +209,30 @@ def handle_cms_path_builder(submissions_file_path: str, path_type: str) -> str:
        - "error - invalid cms path type": The provided CMS path type is invalid.
        - "error - excel file columns": The columns in the Excel file are invalid.
        - "error - cms path": The CMS path is invalid.
+       - "error - directory cache with index file": Both a directory cache and an index file were given.
    """
-
+    instrumentation = RunInstrumentation(enabled=instrument)
+    with instrumentation:
+        result = _build_cms_paths(submissions_file_path, path_type, directory_cache, index_file_path, verify_on_hit,
+                                  max_workers, streaming, output_file_path, instrumentation, incremental)
+    if instrument:
+        _report_run(instrumentation, report_file_path or PATH_BUILDER_REPORT_FILE_NAME)
+    return result
+
+
+def _build_cms_paths(submissions_file_path: str, path_type: str, directory_cache: DirectoryCache,
+                     index_file_path: str, verify_on_hit: bool, max_workers: int, streaming: bool,
+                     output_file_path: str, instrumentation: RunInstrumentation, incremental: bool = False) -> str:
+    """
+    Build the CMS paths for handle_cms_path_builder, which documents the parameters and return values.
+    """
     if not os.path.isfile(submissions_file_path):
         return "error - file path"
 
     if not submissions_file_path.endswith(".xlsx"):
         return "error - file path"
 
-    if not os.path.exists("Y:\\HC"):
+    if not os.path.exists(VPN_CHECK_PATH):
         return "error - not connected to vpn and oes"
 
     cms_path = os.path.join(DRIVE_LETTER, CMS_FOLDER)
@@ -50,84 +249,256 @@ def handle_cms_path_builder(submissions_file_path: str, path_type: str) -> str:
     if not valid_path_type:
         return "error - invalid cms path type"
 
-    wb = openpyxl.load_workbook(submissions_file_path)
+    if directory_cache is not None and index_file_path is not None:
+        return "error - directory cache with index file"
+
+    # openpyxl is slow to import, so it is only loaded once a tool runs
+    import openpyxl
+    with instrumentation.timed("openpyxl.load_workbook"):
+        wb = openpyxl.load_workbook(submissions_file_path, read_only=streaming)
     ws = wb.active
 
     path_builder = MapPathBuilder()
-    path_finder = PathFinder()
 
-    submissions_col = ws.cell(row=1, column=1).value
-    source_col = ws.cell(row=1, column=2).value
-
-    if submissions_col is None or source_col is None:
+    if not has_columns(read_header(ws), [CMSSubmissionsFileExcelColumns.SUBMISSION,
+                                         CMSSubmissionsFileExcelColumns.SOURCE]):
         return "error - excel file columns"
 
-    if submissions_col.lower() != CMSSubmissionsFileExcelColumns.SUBMISSION.value.lower() or source_col.lower() != CMSSubmissionsFileExcelColumns.SOURCE.value.lower():
-        return "error - excel file columns"
+    cms_index = CMSIndex(index_file_path, verify_on_hit) if index_file_path is not None else None
+    if directory_cache is None:
+        directory_cache = DirectoryCache(source=cms_index)
+    path_finder = PathFinder(directory_cache)
+
+    # Stream the rows through in chunks and write the results to a side file
+    if streaming:
+        with ResultWriter(output_file_path or results_file_path(submissions_file_path),
+                          [CMSSubmissionsFileExcelColumns.SUBMISSION, CMSSubmissionsFileExcelColumns.SOURCE,
+                           CMSSubmissionsFileExcelColumns.DESTINATION]) as writer:
+            first_row_number = 2
+            for rows in iter_chunks(iter_rows(ws, 3), STREAMING_CHUNK_SIZE):
+                paths = _resolve_rows([row[0] for row in rows], path_type, path_builder, path_finder, cms_index,
+                                      max_workers, instrumentation, first_row_number,
+                                      [row[2] for row in rows] if incremental else None)
+                first_row_number += len(rows)
+                for row, path in zip(rows, paths):
+                    # Rows without the numbers the path type needs keep their Destination, as in the in-place mode
+                    writer.append((row[0], row[1], path if path is not None else row[2]))
+        wb.close()
+        if cms_index is not None:
+            cms_index.close()
+        return "success"
 
     ws.cell(row=1, column=3).value = CMSSubmissionsFileExcelColumns.DESTINATION.value
 
-    row_count = 2
-    for row in ws.iter_rows(min_row=2, max_col=2, values_only=True):
-        if path_type == CMSPathTypes.PRODUCT.value:
-            matches = re.findall(r"\b\d{6}", str(row[0]).lower())
-            # File and submission number
-            if len(matches) == 2:
-                try:
-                    path = path_finder.find_product_folder(path_builder.build_product_path(str(matches[0])),
-                                                           str(matches[0]),
-                                                           str(matches[1]))
-                    ws.cell(row=row_count, column=3).value = path if path is not None else ""
-
-                except FileNotFoundError:
-                    ws.cell(row=row_count, column=3).value = ""
-
-            # File number only
-            elif len(matches) == 1:
-                try:
-                    path = path_finder.find_product_folder(path_builder.build_product_path(str(matches[0])),
-                                                           str(matches[0]))
-                    ws.cell(row=row_count, column=3).value = path if path is not None else ""
-
-                except FileNotFoundError:
-                    ws.cell(row=row_count, column=3).value = ""
-
-        elif path_type == CMSPathTypes.PRODUCT_POST_LICENCE_FOLDER.value:
-            matches = re.findall(r"\b\d{6}", str(row[0]).lower())
-            try:
-                # Look for post licence folder
-                path = path_finder.find_product_post_licence_folder(
-                    path_builder.build_product_path(str(matches[0])),
-                    str(matches[0]))
-                ws.cell(row=row_count, column=3).value = path if path is not None else ""
-
-            except FileNotFoundError:
-                ws.cell(row=row_count, column=3).value = ""
-
-        elif path_type == "Site" or path_type == "Foreign Site":
-            return "error"
-        elif path_type == "Trading Partner":
-            return "error"
-        elif path_type == "Clinical Trial":
-            return "error"
-        elif path_type == "Company":
-            return "error"
-        elif path_type == "Master File":
-            return "error"
-
-        row_count += 1
-
-    wb.save(submissions_file_path)
+    rows = list(iter_rows(ws, 3 if incremental else 2))
+
+    paths = _resolve_rows([row[0] for row in rows], path_type, path_builder, path_finder, cms_index, max_workers,
+                          instrumentation, destinations=[row[2] for row in rows] if incremental else None)
+    for row_count, path in enumerate(paths, start=2):
+        # Rows without the numbers the path type needs are left as they are
+        if path is not None:
+            ws.cell(row=row_count, column=3).value = path
+
+    with instrumentation.timed("openpyxl.save"):
+        wb.save(submissions_file_path)
+    if cms_index is not None:
+        cms_index.close()
     return "success"
 
 
-def handle_bulk_uploader(file_path: str, generate_log_file: bool, create_missing_paths: bool) -> str:
+def _destination_is_current(source: str, destination: str, compare_mode: str, hash_cache: HashCache = None) -> bool:
+    """
+    Check if a file that already exists at the destination is the same as its source.
+
+    :param source: The path of the source file.
+    :param destination: The path of the existing destination file.
+    :param compare_mode: The CMSCompareModes value to compare the files with.
+    :param hash_cache: (Optional) The hash cache used to compare file contents in Content mode.
+
+    :return: True if the destination is up to date, False if it should be copied again.
+    """
+    # Name only - Any existing file counts as uploaded
+    if compare_mode == CMSCompareModes.NAME.value:
+        return True
+
+    source_stat = os.stat(source)
+    destination_stat = os.stat(destination)
+    if source_stat.st_size != destination_stat.st_size:
+        return False
+
+    same_mtime = abs(source_stat.st_mtime - destination_stat.st_mtime) < MTIME_TOLERANCE_SECONDS
+    if compare_mode == CMSCompareModes.SIZE_AND_MTIME.value:
+        return same_mtime
+
+    # Content - Files with the same size and modified time are trusted, the rest are compared by hash
+    return same_mtime or hash_cache.get_hash(source, source_stat) == hash_cache.get_hash(destination, destination_stat)
+
+
+def _upload_row(row, create_missing_paths: bool, copy_engine: CopyEngine, file_copier: FileCopier,
+                directory_cache: DirectoryCache = None, compare_mode: str = CMSCompareModes.NAME.value,
+                hash_cache: HashCache = None, copy_plan: CopyPlan = None,
+                transfer_controller: TransferController = None) -> tuple:
+    """
+    Copy the source file of a row of the submissions file to its destination.
+
+    :param row: The Submission, Source and Destination values of the row.
+    :param create_missing_paths: A boolean indicating whether to create missing paths in the CMS.
+    :param copy_engine: The copy engine running the row, used to lock the destination folder.
+    :param file_copier: The file copier used to copy the source file.
+    :param directory_cache: (Optional) The directory listing cache to invalidate when paths are created.
+    :param compare_mode: The CMSCompareModes value used to decide if an existing destination file is up to date.
+    :param hash_cache: (Optional) The hash cache used to compare file contents in Content mode.
+    :param copy_plan: (Optional) The compiled plan of the run, used to check for and create the destination folder and
+        file instead of checking the share for every row.
+    :param transfer_controller: (Optional) The controller used to retry transient errors, limit the copies in flight
+        and wait for the share if it disappears.
+
+    :return: A tuple of the CMSUploadOutcomes value of the row, the list of progress messages for the row, the error
+        message or None if there wasn't one, and the CopyResult or None if nothing was copied.
+    """
+    messages = []
+    try:
+        messages.append(f"Working on copying {row[1]} to {row[2]}")
+
+        def transfer():
+            result = _transfer_row(row, messages, create_missing_paths, copy_engine, file_copier, directory_cache,
+                                   compare_mode, hash_cache, copy_plan)
+            # A destination looks missing when the whole share is gone - Wait for it instead of skipping the row
+            if transfer_controller is not None and result[0] == CMSUploadOutcomes.MISSING_PATH.value and \
+                    not transfer_controller.share_available():
+                raise ShareUnavailableError("The CMS share is unavailable")
+            return result
+
+        if transfer_controller is None:
+            return transfer()
+
+        def on_retry(error, attempt, delay):
+            messages.append(f"Attempt {attempt} failed with {error}! Retrying in {delay:.1f}s...")
+
+        return transfer_controller.run(transfer, on_retry)
+    except Exception as e:
+        return CMSUploadOutcomes.ERROR.value, messages, str(e), None
+
+
+def _transfer_row(row, messages: list, create_missing_paths: bool, copy_engine: CopyEngine, file_copier: FileCopier,
+                  directory_cache: DirectoryCache, compare_mode: str, hash_cache: HashCache,
+                  copy_plan: CopyPlan) -> tuple:
+    """
+    Copy the source file of a row for _upload_row, which documents the parameters and return values. Errors are raised
+    rather than returned, so they can be retried.
+
+    :param messages: The list to add the row's progress messages to.
+    """
+    source_file = os.path.basename(row[1])
+    # Check if row destination is empty
+    if row[2] is None:
+        messages.append("Row destination is empty! Skipping...")
+        return CMSUploadOutcomes.EMPTY_DESTINATION.value, messages, None, None
+
+    with copy_engine.destination_lock(row[2]):
+        # Check CMS to see if the folder path of the destination exists
+        folder_exists = copy_plan.folder_exists(row[2]) if copy_plan is not None else os.path.exists(row[2])
+        if not folder_exists:
+            messages.append("Destination folder path doesn't exist in CMS!")
+
+            # Create the path
+            if create_missing_paths:
+                # Create the necessary directories (destination)
+                if copy_plan is not None:
+                    copy_plan.create_folder(row[2], directory_cache)
+                elif directory_cache is not None:
+                    directory_cache.makedirs(row[2])
+                else:
+                    os.makedirs(row[2])
+                # Copy source file to the destination
+                copy_result = file_copier.copy(row[1], row[2])
+                if copy_plan is not None:
+                    copy_plan.record_file(row[2], source_file)
+                if directory_cache is not None:
+                    directory_cache.invalidate(row[2])
+                messages.append("Created missing path and copied file to it!")
+                messages.append(str(copy_result))
+                return CMSUploadOutcomes.CREATED.value, messages, None, copy_result
+
+            # If the folder create missing paths is not checked exist skip
+            messages.append("Skipping...")
+            return CMSUploadOutcomes.MISSING_PATH.value, messages, None, None
+
+    with copy_engine.destination_lock(os.path.join(row[2], source_file)):
+        # Check CMS to see if the source file already exists at the destination
+        file_exists = copy_plan.file_exists(row[2], source_file) if copy_plan is not None else \
+            os.path.exists(os.path.join(row[2], source_file))
+        if not file_exists:
+            # Copy source file to the destination
+            copy_result = file_copier.copy(row[1], row[2])
+            if copy_plan is not None:
+                copy_plan.record_file(row[2], source_file)
+            if directory_cache is not None:
+                directory_cache.invalidate(row[2])
+            messages.append("File copied successfully!")
+            messages.append(str(copy_result))
+            return CMSUploadOutcomes.COPIED.value, messages, None, copy_result
+
+        # If the file exists and is up to date don't overwrite it
+        if _destination_is_current(row[1], os.path.join(row[2], source_file), compare_mode, hash_cache):
+            messages.append("File already exists at the destination! No creation necessary...")
+            return CMSUploadOutcomes.EXISTS.value, messages, None, None
+
+        # The file at the destination is stale or partial - Replace it
+        copy_result = file_copier.copy(row[1], row[2])
+        if directory_cache is not None:
+            directory_cache.invalidate(row[2])
+        messages.append("File at the destination is out of date! Copied the latest version...")
+        messages.append(str(copy_result))
+        return CMSUploadOutcomes.UPDATED.value, messages, None, copy_result
+
+
+def handle_bulk_uploader(file_path: str, generate_log_file: bool, create_missing_paths: bool,
+                         directory_cache: DirectoryCache = None, max_workers: int = 1, streaming: bool = False,
+                         output_file_path: str = None, resume: bool = False, journal_file_path: str = None,
+                         buffer_size: int = DEFAULT_BUFFER_SIZE, verify_copies: bool = False,
+                         compare_mode: str = CMSCompareModes.NAME.value, hash_cache_file_path: str = None,
+                         instrument: bool = False, report_file_path: str = None,
+                         structured_log_file_path: str = None, show_progress: bool = True,
+                         plan_copies: bool = False, dry_run: bool = False, adaptive_transfers: bool = False) -> str:
     """
     Handle bulk uploading of files to the CMS based on the information provided in the Excel file.
 
     :param file_path: The path to the Excel file containing file upload information.
     :param generate_log_file: A boolean indicating whether to generate a log file during the upload process.
     :param create_missing_paths: A boolean indicating whether to create missing paths in the CMS during the upload process.
+    :param directory_cache: (Optional) The directory listing cache to invalidate when missing paths are created.
+    :param max_workers: The number of files to copy at the same time. Results are still reported in row order.
+    :param streaming: A boolean indicating whether to stream the rows from a read-only workbook and write each row's
+        result to a side file.
+    :param output_file_path: (Optional) The .xlsx or .csv file to write the streamed results to. Default is a
+        "_results.xlsx" file next to the Excel file.
+    :param resume: A boolean indicating whether to skip the rows the journal confirms were uploaded by a previous run.
+        Skipped rows are reported as Resumed and aren't journaled again.
+    :param journal_file_path: (Optional) The JSONL journal to record each row's outcome in. Default is a
+        "_journal.jsonl" file next to the Excel file.
+    :param buffer_size: The number of bytes to copy per read or system call.
+    :param verify_copies: A boolean indicating whether to checksum each source while copying it and re-read the
+        destination to confirm the bytes arrived intact.
+    :param compare_mode: The CMSCompareModes value used to decide if a file that already exists at the destination is
+        up to date. Name skips any existing file, Size and Modified Time and Content copy stale files again.
+    :param hash_cache_file_path: (Optional) The SQLite file to cache content hashes in for Content mode. Default is
+        bulkUploaderHashes.db in the working directory.
+    :param instrument: A boolean indicating whether to count and time the file system calls and rows of the run and
+        report a summary at the end.
+    :param report_file_path: (Optional) The JSON file to write the instrumentation report to. Default is
+        bulkUploaderReport.json in the working directory, next to the log file.
+    :param structured_log_file_path: (Optional) The JSONL file to write one record per row to, with the row number,
+        source, destination, outcome, bytes copied and duration.
+    :param show_progress: A boolean indicating whether to show a progress display on the console instead of nothing.
+        Rows are no longer printed one by one - their messages are in the log file.
+    :param plan_copies: A boolean indicating whether to read the whole sheet into a copy plan first. Each destination
+        folder is then checked once and created at most once, and the rows run grouped and sorted by destination folder
+        instead of in sheet order.
+    :param dry_run: A boolean indicating whether to only compile and print the copy plan without copying anything.
+    :param adaptive_transfers: A boolean indicating whether to retry transient errors with backoff, adjust the number of
+        copies in flight between 1 and max_workers to the share's latency and error rate, and pause while the share is
+        unavailable instead of failing the remaining rows.
 
     :return: A string indicating the outcome of the bulk uploading process.
         Possible return values:
@@ -136,105 +507,275 @@ def handle_bulk_uploader(file_path: str, generate_log_file: bool, create_missing
         - "error - excel file columns": The columns in the Excel file are invalid.
         - "error - cms path": The CMS path is invalid.
     """
+    instrumentation = RunInstrumentation(enabled=instrument)
+    run_logger = RunLogger("bulk_uploader", BULK_UPLOADER_LOG_FILE_NAME if generate_log_file else None,
+                           structured_log_file_path, show_progress, PROGRESS_REFRESH_SECONDS)
+    with run_logger:
+        with instrumentation:
+            result = _upload_bulk_files(file_path, create_missing_paths, directory_cache, max_workers, streaming,
+                                        output_file_path, resume, journal_file_path, buffer_size, verify_copies,
+                                        compare_mode, hash_cache_file_path, plan_copies, dry_run,
+                                        adaptive_transfers, instrumentation, run_logger)
+        if instrument:
+            _report_run(instrumentation, report_file_path or BULK_UPLOADER_REPORT_FILE_NAME, run_logger)
+    return result
+
+
+def _upload_bulk_files(file_path: str, create_missing_paths: bool, directory_cache: DirectoryCache, max_workers: int,
+                       streaming: bool, output_file_path: str, resume: bool, journal_file_path: str, buffer_size: int,
+                       verify_copies: bool, compare_mode: str, hash_cache_file_path: str, plan_copies: bool,
+                       dry_run: bool, adaptive_transfers: bool, instrumentation: RunInstrumentation,
+                       run_logger: RunLogger) -> str:
+    """
+    Upload the files for handle_bulk_uploader, which documents the parameters and return values.
+    """
     if not os.path.isfile(file_path):
         return "error - file path"
 
     if not file_path.endswith(".xlsx"):
         return "error - file path"
 
-    if not os.path.exists("Y:\\HC"):
+    if not os.path.exists(VPN_CHECK_PATH):
         return "error - not connected to vpn and oes"
 
     cms_path = os.path.join(DRIVE_LETTER, CMS_FOLDER)
     if not os.path.isdir(cms_path):
         return "error - cms path"
 
-    wb = openpyxl.load_workbook(file_path)
+    import openpyxl
+    with instrumentation.timed("openpyxl.load_workbook"):
+        wb = openpyxl.load_workbook(file_path, read_only=streaming)
     ws = wb.active
 
-    submissions_col = ws.cell(row=1, column=1).value
-    source_col = ws.cell(row=1, column=2).value
-    dest_col = ws.cell(row=1, column=3).value
-
-    if submissions_col is None or source_col is None or dest_col is None:
+    if not has_columns(read_header(ws), [CMSSubmissionsFileExcelColumns.SUBMISSION,
+                                         CMSSubmissionsFileExcelColumns.SOURCE,
+                                         CMSSubmissionsFileExcelColumns.DESTINATION]):
         return "error - excel file columns"
 
-    if (submissions_col.lower() != CMSSubmissionsFileExcelColumns.SUBMISSION.value.lower() or
-            source_col.lower() != CMSSubmissionsFileExcelColumns.SOURCE.value.lower() or
-            dest_col.lower() != CMSSubmissionsFileExcelColumns.DESTINATION.value.lower()):
-        return "error - excel file columns"
+    if streaming:
+        rows = iter_rows(ws, 3)
+    else:
+        rows = list(ws.iter_rows(min_row=2, max_col=3, values_only=True))
+    numbered_rows = enumerate(rows, start=2)
+
+    # Read the whole sheet first and work out what each destination folder needs
+    copy_plan = None
+    if plan_copies or dry_run:
+        copy_plan = CopyPlan.compile(numbered_rows)
+        if dry_run:
+            run_logger.start(description="Planning", progress=False)
+            for line in copy_plan.summary_lines(create_missing_paths):
+                print(line)
+                run_logger.info(line)
+            wb.close()
+            return "success"
+        numbered_rows = copy_plan.ordered_rows()
+
+    copy_engine = CopyEngine(max_workers)
+
+    file_copier = FileCopier(buffer_size, verify=verify_copies)
+    hash_cache = HashCache(hash_cache_file_path or HASH_CACHE_FILE_NAME) \
+        if compare_mode == CMSCompareModes.CONTENT.value else None
+    journal = UploadJournal(journal_file_path or UploadJournal.journal_file_path_for(file_path), resume)
+    transfer_controller = TransferController([VPN_CHECK_PATH, cms_path], max_workers,
+                                             max_attempts=RETRY_MAX_ATTEMPTS,
+                                             base_delay_seconds=RETRY_BASE_DELAY_SECONDS,
+                                             max_delay_seconds=RETRY_MAX_DELAY_SECONDS,
+                                             pause_timeout_seconds=SHARE_PAUSE_TIMEOUT_SECONDS,
+                                             poll_seconds=SHARE_POLL_SECONDS) if adaptive_transfers else None
+
+    def upload_row(numbered_row):
+        row_number, row = numbered_row
+        # Skip rows a previous run already confirmed without touching the CMS again
+        confirmed_outcome = journal.confirmed_outcome(row[1], row[2]) if resume else None
+        if confirmed_outcome is not None:
+            messages = [f"Working on copying {row[1]} to {row[2]}",
+                        f"Already uploaded in a previous run ({confirmed_outcome})! Skipping..."]
+            return row_number, row, (CMSUploadOutcomes.RESUMED.value, messages, None, None), 0.0
+        start = time.perf_counter()
+        with instrumentation.row(row_number, row[0]):
+            result = _upload_row(row, create_missing_paths, copy_engine, file_copier, directory_cache, compare_mode,
+                                 hash_cache, copy_plan, transfer_controller)
+        return row_number, row, result, time.perf_counter() - start
+
+    writer = None
+    if streaming:
+        writer = ResultWriter(output_file_path or results_file_path(file_path),
+                              [CMSSubmissionsFileExcelColumns.SUBMISSION, CMSSubmissionsFileExcelColumns.SOURCE,
+                               CMSSubmissionsFileExcelColumns.DESTINATION, CMSSubmissionsFileExcelColumns.RESULT])
+
+    run_logger.start(len(rows) if not streaming else len(numbered_rows) if copy_plan is not None else None,
+                     "Uploading")
+    run_logger.info("File upload started...")
+    for row_number, row, (outcome, messages, error, copy_result), seconds in copy_engine.run(numbered_rows,
+                                                                                             upload_row):
+        run_logger.row(row_number, row, outcome, messages, error, copy_result, seconds)
+        journal.record(row_number, row, outcome, error, copy_result)
+        if writer is not None:
+            writer.append((row[0], row[1], row[2], error if error is not None else outcome))
+
+    if transfer_controller is not None:
+        print(transfer_controller.summary())
+        run_logger.info(transfer_controller.summary())
+    journal.close()
+    if hash_cache is not None:
+        hash_cache.close()
+    if writer is not None:
+        writer.close()
+        wb.close()
 
-    # Configure the logger
-    if generate_log_file:
-        logging.basicConfig(level=logging.INFO, filename="bulkUploader.log", filemode="w",
-                            format="%(asctime)s - %(levelname)s - %(message)s")
-        logging.info("File upload started...")
+    return "success"
 
-    for row in ws.iter_rows(min_row=2, max_col=3, values_only=True):
-        try:
-            print(f"{str(row[0])}")
-            print(f"Working on copying {row[1]} to {row[2]}")
-            if generate_log_file:
-                logging.info(f"Working on copying {row[1]} to {row[2]}")
-
-            source_file = os.path.basename(row[1])
-            # Check if row destination is empty
-            if row[2] is None:
-                print("Row destination is empty! Skipping...")
-                if generate_log_file:
-                    logging.info("Row destination is empty! Skipping...")
-
-            # Check CMS to see if the folder path of the destination exists
-            elif not os.path.exists(row[2]):
-                print("Destination folder path doesn't exist in CMS!")
-                if generate_log_file:
-                    logging.info("Destination folder path doesn't exist in CMS!")
-
-                # Create the path
-                if create_missing_paths:
-                    # Create the necessary directories (destination)
-                    os.makedirs(row[2])
-                    # Copy source file to the destination
-                    shutil.copy2(row[1], row[2])
-                    print("Created missing path and copied file to it!")
-                    if generate_log_file:
-                        logging.info("Created missing path and copied file to it!")
 
-                # If the folder create missing paths is not checked exist skip
-                else:
-                    print("Skipping...")
-                    if generate_log_file:
-                        logging.info("Skipping...")
+def handle_cms_pipeline(file_path: str, path_type: str, generate_log_file: bool, create_missing_paths: bool,
+                        directory_cache: DirectoryCache = None, resolve_workers: int = 4, copy_workers: int = 4,
+                        queue_size: int = PIPELINE_QUEUE_SIZE, output_file_path: str = None,
+                        journal_file_path: str = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                        compare_mode: str = CMSCompareModes.NAME.value, hash_cache_file_path: str = None,
+                        structured_log_file_path: str = None, show_progress: bool = True) -> str:
+    """
+    Handle building the CMS paths of a submissions file and uploading its files to them in one run.
 
-            # Check CMS to see if the source file already exists at the destination
-            elif not os.path.exists(os.path.join(row[2], source_file)):
-                # Copy source file to the destination
-                shutil.copy2(row[1], row[2])
-                print("File copied successfully!")
-                if generate_log_file:
-                    logging.info("File copied successfully!")
-
-            # If the file exists don't overwrite it
-            else:
-                print("File already exists at the destination! No creation necessary...")
-                if generate_log_file:
-                    logging.info("File already exists at the destination! No creation necessary...")
+    The rows are streamed from a read-only workbook. Each row's destination is resolved as soon as it is read and its
+    file is copied as soon as the destination is known, so the Path Builder and Bulk Uploader work overlaps instead of
+    running one after the other. Rows that already have a Destination are copied there without resolving it again.
+
+    :param file_path: The path to the Excel file containing the Submission and Source columns, and optionally the
+        Destination column.
+    :param path_type: The type of CMS path to build.
+    :param generate_log_file: A boolean indicating whether to generate a log file during the run.
+    :param create_missing_paths: A boolean indicating whether to create missing paths in the CMS during the upload process.
+    :param directory_cache: (Optional) The directory listing cache to use for the run. A new one is created if none is
+        given.
+    :param resolve_workers: The number of destinations to resolve at the same time.
+    :param copy_workers: The number of files to copy at the same time.
+    :param queue_size: The maximum number of rows waiting between two stages.
+    :param output_file_path: (Optional) The .xlsx or .csv file to write the results to. Default is a "_results.xlsx"
+        file next to the Excel file.
+    :param journal_file_path: (Optional) The JSONL journal to record each row's outcome in. Default is a
+        "_journal.jsonl" file next to the Excel file.
+    :param buffer_size: The number of bytes to copy per read or system call.
+    :param compare_mode: The CMSCompareModes value used to decide if a file that already exists at the destination is
+        up to date.
+    :param hash_cache_file_path: (Optional) The SQLite file to cache content hashes in for Content mode. Default is
+        bulkUploaderHashes.db in the working directory.
+    :param structured_log_file_path: (Optional) The JSONL file to write one record per row to, with the row number,
+        source, destination, outcome, bytes copied and duration.
+    :param show_progress: A boolean indicating whether to show a progress display on the console.
+
+    :return: A string indicating the outcome of the run.
+        Possible return values:
+        - "success": The run was successful.
+        - "error - file path": The provided file path is invalid.
+        - "error - invalid cms path type": The provided CMS path type is invalid.
+        - "error - excel file columns": The columns in the Excel file are invalid.
+        - "error - cms path": The CMS path is invalid.
+    """
+    if not os.path.isfile(file_path):
+        return "error - file path"
+
+    if not file_path.endswith(".xlsx"):
+        return "error - file path"
+
+    if not os.path.exists(VPN_CHECK_PATH):
+        return "error - not connected to vpn and oes"
+
+    cms_path = os.path.join(DRIVE_LETTER, CMS_FOLDER)
+    if not os.path.isdir(cms_path):
+        return "error - cms path"
+
+    if path_type not in CMSPathTypes.get_values():
+        return "error - invalid cms path type"
+
+    import openpyxl
+    from staged_pipeline import StagedPipeline
+    wb = openpyxl.load_workbook(file_path, read_only=True)
+    ws = wb.active
+
+    if not has_columns(read_header(ws), [CMSSubmissionsFileExcelColumns.SUBMISSION,
+                                         CMSSubmissionsFileExcelColumns.SOURCE]):
+        wb.close()
+        return "error - excel file columns"
+
+    path_builder = MapPathBuilder()
+    path_finder = PathFinder(directory_cache if directory_cache is not None else DirectoryCache())
+    copy_engine = CopyEngine(copy_workers)
+    file_copier = FileCopier(buffer_size)
+    hash_cache = HashCache(hash_cache_file_path or HASH_CACHE_FILE_NAME) \
+        if compare_mode == CMSCompareModes.CONTENT.value else None
+    journal = UploadJournal(journal_file_path or UploadJournal.journal_file_path_for(file_path))
+
+    def resolve_row(numbered_row):
+        row = numbered_row[1]
+        if row[2] is not None:
+            return row, None
+        try:
+            destination = _resolve_row(row[0], path_type, path_builder, path_finder)
         except Exception as e:
-            # Log the error
-            if generate_log_file:
-                logging.error(str(e))
+            return row, (CMSUploadOutcomes.ERROR.value, [f"Working on finding the destination of {row[0]}"], str(e),
+                         None)
+        return (row[0], row[1], destination or None), None
+
+    row_seconds = {}
+
+    def upload_row(numbered_row):
+        start = time.perf_counter()
+        result = _upload_row(numbered_row[1], create_missing_paths, copy_engine, file_copier,
+                             path_finder.directory_cache, compare_mode, hash_cache)
+        row_seconds[numbered_row[0]] = time.perf_counter() - start
+        return result
+
+    with ResultWriter(output_file_path or results_file_path(file_path),
+                      [CMSSubmissionsFileExcelColumns.SUBMISSION, CMSSubmissionsFileExcelColumns.SOURCE,
+                       CMSSubmissionsFileExcelColumns.DESTINATION, CMSSubmissionsFileExcelColumns.RESULT]) as writer, \
+            RunLogger("pipeline", PIPELINE_LOG_FILE_NAME if generate_log_file else None, structured_log_file_path,
+                      show_progress, PROGRESS_REFRESH_SECONDS) as run_logger:
+        run_logger.start(description="Resolving and uploading")
+        run_logger.info("Pipeline started...")
+
+        def on_result(row_number, row, result):
+            outcome, messages, error, copy_result = result
+            run_logger.row(row_number, row, outcome, messages, error, copy_result, row_seconds.pop(row_number, None))
+            journal.record(row_number, row, outcome, error, copy_result)
+            writer.append((row[0], row[1], row[2], error if error is not None else outcome))
+
+        pipeline = StagedPipeline(resolve_row, upload_row, resolve_workers, copy_workers, queue_size,
+                                  PIPELINE_READ_CHUNK_SIZE)
+        pipeline.run(enumerate(iter_rows(ws, 3), start=2), on_result)
+
+    journal.close()
+    if hash_cache is not None:
+        hash_cache.close()
+    wb.close()
 
     return "success"
 
 
+def _report_run(instrumentation: RunInstrumentation, report_file_path: str, run_logger: RunLogger = None):
+    """
+    Print the instrumentation summary of a run and write its report file.
+
+    :param instrumentation: The instrumentation of the run.
+    :param report_file_path: The JSON file to write the report to.
+    :param run_logger: (Optional) The logger of the run, to also write the summary to its log.
+    """
+    for line in instrumentation.summary_lines():
+        print(line)
+        if run_logger is not None:
+            run_logger.info(line)
+    instrumentation.write_report(report_file_path)
+
+
 def run_app():
+    from rich.console import Console
+    from rich.prompt import Prompt
     console = Console()
     console.print("CMS Automation Tool", style="bold green")
     console.print(f"{'-'*50}", style="bold blue")
 
     while True:
 
-        tool_selection_input = Prompt.ask(prompt="[bold green]Which tool would you like to use?[/bold green]", choices=["Path Builder", "Bulk Uploader"], show_choices=True, case_sensitive=False, console=console)
+        tool_selection_input = Prompt.ask(prompt="[bold green]Which tool would you like to use?[/bold green]", choices=CMSTools.get_values(), show_choices=True, case_sensitive=False, console=console)
 
         results = ""
 
@@ -242,12 +783,21 @@ def run_app():
             file_path_input = Prompt.ask("[bold green]Enter path to the file containing submissions[/bold green]", console=console)
             type_choices = CMSPathTypes.get_values()
             path_type_input = Prompt.ask(prompt="[bold green]Enter the type of path to build", choices=type_choices, show_choices=True, case_sensitive=False, console=console)
-            results = handle_cms_path_builder(file_path_input, path_type_input)
+            incremental_input = "No"
+            if path_type_input.lower() in [value.lower() for value in CMSPathTypes.get_product_values()]:
+                incremental_input = Prompt.ask(prompt="[bold green]Keep the destinations that are still valid and only build new, blank and stale rows?[/bold green]", choices=["Yes", "No"], show_choices=True, case_sensitive=False, console=console)
+            results = handle_cms_path_builder(file_path_input, path_type_input, incremental=incremental_input.lower() == "yes")
 
         elif tool_selection_input.lower() == CMSTools.BULK_UPLOADER.value.lower():
             file_path_input = Prompt.ask("[bold green]Enter path to the file containing submissions, along with their source and destination information[/bold green]", console=console)
             results = handle_bulk_uploader(file_path_input, True, True)
 
+        elif tool_selection_input.lower() == CMSTools.PIPELINE.value.lower():
+            file_path_input = Prompt.ask("[bold green]Enter path to the file containing submissions, along with their source information[/bold green]", console=console)
+            type_choices = CMSPathTypes.get_values()
+            path_type_input = Prompt.ask(prompt="[bold green]Enter the type of path to build", choices=type_choices, show_choices=True, case_sensitive=False, console=console)
+            results = handle_cms_pipeline(file_path_input, path_type_input, True, True)
+
         console.print(f"{results}", style="bold green")
         run_another_input = Prompt.ask(prompt="[bold blue]Would you like to run another tool?[/bold blue]", choices=["Yes", "No"], show_choices=True, case_sensitive=False, console=console)
 
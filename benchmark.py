@@ -0,0 +1,155 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from rich.console import Console
+from rich.table import Table
+
+
+def run_benchmarks(work_path: str, products: int, rows: int, latency_ms: float, max_workers: int,
+                   file_size: int) -> list:
+    """
+    Generate a synthetic CMS tree and benchmark the Path Builder and Bulk Uploader against it.
+
+    :param work_path: The folder to build the CMS tree and submissions files in.
+    :param products: The number of product folders to generate.
+    :param rows: The number of rows in each submissions file.
+    :param latency_ms: The latency in milliseconds to add to each file system call in the CMS tree.
+    :param max_workers: The number of workers the tools run with.
+    :param file_size: The size in bytes of each file uploaded by the Bulk Uploader.
+
+    :return: A list of (benchmark name, rows per second, file system calls per row, copy MB/s) tuples.
+    """
+    drive_path = os.path.join(work_path, "cms")
+    vpn_path = os.path.join(work_path, "vpn")
+    os.makedirs(vpn_path, exist_ok=True)
+
+    # The tools read the CMS root when they are first imported, so point them at the synthetic tree before that
+    os.environ["CMS_DRIVE_LETTER"] = drive_path
+    os.environ["CMS_VPN_CHECK_PATH"] = vpn_path
+    from constants import CMS_FOLDER
+    from enums import CMSPathTypes
+    from app import handle_cms_path_builder, handle_bulk_uploader
+    from synthetic_cms import (FilesystemLatencyShim, generate_cms_tree, generate_path_builder_workbook,
+                               generate_bulk_uploader_workbook)
+
+    cms_path = os.path.join(drive_path, CMS_FOLDER)
+    created = generate_cms_tree(cms_path, products)
+    path_builder_file_path = os.path.join(work_path, "path_builder.xlsx")
+    generate_path_builder_workbook(path_builder_file_path, created, rows)
+    bulk_uploader_file_path = os.path.join(work_path, "bulk_uploader.xlsx")
+    generate_bulk_uploader_workbook(bulk_uploader_file_path, os.path.join(work_path, "source"),
+                                    os.path.join(cms_path, "Uploads"), rows, file_size)
+
+    results = []
+    with FilesystemLatencyShim(cms_path, latency_ms / 1000) as shim:
+        for path_type in (CMSPathTypes.PRODUCT.value, CMSPathTypes.PRODUCT_POST_LICENCE_FOLDER.value):
+            shim.reset()
+            start = time.perf_counter()
+            handle_cms_path_builder(path_builder_file_path, path_type, max_workers=max_workers)
+            seconds = time.perf_counter() - start
+            results.append((f"Path Builder - {path_type}", rows / seconds, shim.total_calls / rows, None))
+
+        shim.reset()
+        start = time.perf_counter()
+        handle_bulk_uploader(bulk_uploader_file_path, False, True, max_workers=max_workers,
+                             journal_file_path=os.path.join(work_path, "bulk_uploader_journal.jsonl"),
+                             show_progress=False)
+        seconds = time.perf_counter() - start
+        results.append(("Bulk Uploader", rows / seconds, shim.total_calls / rows,
+                        rows * file_size / (1024 * 1024) / seconds))
+
+    return results
+
+
+def measure_startup(command: list, runs: int = 5, prompt_text: str = "Which tool") -> float:
+    """
+    Measure how long the tool takes to show its first prompt.
+
+    :param command: The command that starts the tool.
+    :param runs: The number of launches to take the median of.
+    :param prompt_text: The text of the first prompt.
+
+    :return: The median number of seconds from launch to the first prompt.
+    """
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        output = b""
+        while prompt_text.encode() not in output:
+            data = os.read(process.stdout.fileno(), 4096)
+            if not data:
+                break
+            output += data
+        timings.append(time.perf_counter() - start)
+        process.kill()
+        process.wait()
+        if prompt_text.encode() not in output:
+            raise RuntimeError(f"{command[0]} exited before showing its first prompt")
+    return sorted(timings)[len(timings) // 2]
+
+
+def run_startup_benchmarks(runs: int) -> list:
+    """
+    Measure the time to first prompt of the source and each packaged build mode that has been built.
+
+    :param runs: The number of launches to take the median of.
+
+    :return: A list of (build mode, seconds) tuples.
+    """
+    from package_app import APP_NAME
+
+    commands = [("source", [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")]),
+                ("onefile", [os.path.abspath(f"{APP_NAME}.exe")]),
+                ("onedir", [os.path.abspath(os.path.join(APP_NAME, f"{APP_NAME}.exe"))])]
+    return [(mode, measure_startup(command, runs)) for mode, command in commands
+            if mode == "source" or os.path.isfile(command[0])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CMS Automation Tool against a synthetic CMS tree.")
+    parser.add_argument("--products", type=int, default=500, help="Number of product folders to generate.")
+    parser.add_argument("--rows", type=int, default=1000, help="Number of rows in each submissions file.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latency to add to each file system call.")
+    parser.add_argument("--workers", type=int, default=1, help="Number of workers the tools run with.")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="Size in bytes of each uploaded file.")
+    parser.add_argument("--work-path", help="Folder to build the tree in. Default is a temporary folder.")
+    parser.add_argument("--startup", action="store_true",
+                        help="Measure the time to first prompt of each build mode instead.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of launches per build mode for --startup.")
+    args = parser.parse_args()
+
+    if args.startup:
+        table = Table(title=f"Time to first prompt, median of {args.runs} launches")
+        table.add_column("Build mode")
+        table.add_column("Seconds", justify="right")
+        for mode, seconds in run_startup_benchmarks(args.runs):
+            table.add_row(mode, f"{seconds:.3f}")
+        Console().print(table)
+        return
+
+    work_path = args.work_path or tempfile.mkdtemp(prefix="cms-benchmark-")
+    try:
+        results = run_benchmarks(work_path, args.products, args.rows, args.latency_ms, args.workers, args.file_size)
+    finally:
+        if args.work_path is None:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+    table = Table(title=f"{args.rows} rows, {args.products} products, {args.latency_ms} ms latency, "
+                        f"{args.workers} workers")
+    table.add_column("Benchmark")
+    table.add_column("Rows/sec", justify="right")
+    table.add_column("FS calls/row", justify="right")
+    table.add_column("Copy MB/s", justify="right")
+    for name, rows_per_second, calls_per_row, megabytes_per_second in results:
+        table.add_row(name, f"{rows_per_second:.1f}", f"{calls_per_row:.2f}",
+                      f"{megabytes_per_second:.2f}" if megabytes_per_second is not None else "-")
+    Console().print(table)
+
+
+if __name__ == "__main__":
+    main()
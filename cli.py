@@ -0,0 +1,326 @@
+import argparse
+import glob
+import os
+import shutil
+import sys
+import time
+from rich.console import Console
+from rich.table import Table
+from app import handle_cms_path_builder, handle_bulk_uploader, handle_cms_pipeline
+from directory_cache import DirectoryCache
+from enums import CMSPathTypes, CMSCompareModes, CMSTools
+from constants import WATCH_POLL_SECONDS, WATCH_PROCESSED_FOLDER_NAME, WATCH_FAILED_FOLDER_NAME, INDEX_TREE_DEPTH, \
+    WATCH_MAX_CACHE_AGE_SECONDS
+
+TOOL_COMMANDS = {
+    "path-builder": CMSTools.PATH_BUILDER.value,
+    "bulk-uploader": CMSTools.BULK_UPLOADER.value,
+    "pipeline": CMSTools.PIPELINE.value,
+}
+
+
+def run_job(args, file_path: str, directory_cache: DirectoryCache) -> str:
+    """
+    Run one workbook through the selected tool.
+
+    :param args: The parsed command line arguments.
+    :param file_path: The path of the workbook.
+    :param directory_cache: The directory listing cache shared by every job of the process.
+
+    :return: The result string returned by the tool.
+    """
+    if args.tool == "path-builder":
+        # Listings read through the index are kept in the index, so the shared cache isn't needed with one
+        return handle_cms_path_builder(file_path, args.path_type,
+                                       directory_cache=None if args.index else directory_cache,
+                                       index_file_path=args.index, verify_on_hit=args.verify_index,
+                                       max_workers=args.workers, streaming=args.streaming, instrument=args.instrument,
+                                       incremental=args.incremental)
+    elif args.tool == "bulk-uploader":
+        return handle_bulk_uploader(file_path, not args.no_log, args.create_missing_paths,
+                                    directory_cache=directory_cache, max_workers=args.workers,
+                                    streaming=args.streaming, resume=args.resume, verify_copies=args.verify,
+                                    compare_mode=args.compare_mode, instrument=args.instrument,
+                                    structured_log_file_path=args.structured_log, show_progress=not args.no_progress,
+                                    plan_copies=args.plan, dry_run=args.dry_run, adaptive_transfers=args.adaptive)
+    return handle_cms_pipeline(file_path, args.path_type, not args.no_log, args.create_missing_paths,
+                               directory_cache=directory_cache, resolve_workers=args.workers,
+                               copy_workers=args.workers, compare_mode=args.compare_mode,
+                               structured_log_file_path=args.structured_log, show_progress=not args.no_progress)
+
+
+def run_batch(args, directory_cache: DirectoryCache, console: Console) -> int:
+    """
+    Run every workbook given on the command line and print a result for each one.
+
+    :return: The exit code, 1 if any workbook failed and 0 otherwise.
+    """
+    file_paths = []
+    for pattern in args.files:
+        file_paths.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    table = Table(title=TOOL_COMMANDS[args.tool])
+    table.add_column("File")
+    table.add_column("Result")
+    table.add_column("Seconds", justify="right")
+    failed = False
+    for file_path in file_paths:
+        start = time.perf_counter()
+        try:
+            result = run_job(args, file_path, directory_cache)
+        except Exception as e:
+            result = f"error - {e}"
+        failed = failed or result != "success"
+        table.add_row(file_path, result, f"{time.perf_counter() - start:.2f}")
+    console.print(table)
+    return 1 if failed else 0
+
+
+def _is_workbook(file_name: str) -> bool:
+    # Skip Excel lock files and the result side files the tools write next to the workbooks
+    return file_name.endswith(".xlsx") and not file_name.startswith("~$") and \
+        not os.path.splitext(file_name)[0].endswith("_results")
+
+
+def _move_to(file_path: str, folder_name: str) -> str:
+    folder_path = os.path.join(os.path.dirname(file_path), folder_name)
+    os.makedirs(folder_path, exist_ok=True)
+    destination = os.path.join(folder_path, os.path.basename(file_path))
+    if os.path.exists(destination):
+        stem, extension = os.path.splitext(os.path.basename(file_path))
+        destination = os.path.join(folder_path, f"{stem} {time.strftime('%Y%m%d-%H%M%S')}{extension}")
+    shutil.move(file_path, destination)
+    return destination
+
+
+def _move_job_files(file_path: str, folder_name: str):
+    # Move the side files first, so a workbook that is still in the watched folder still has its result files
+    stem = glob.escape(os.path.splitext(file_path)[0])
+    for side_file in glob.glob(stem + "_results.*") + glob.glob(stem + "_journal.jsonl"):
+        _move_to(side_file, folder_name)
+    _move_to(file_path, folder_name)
+
+
+def run_watch(args, directory_cache: DirectoryCache, console: Console):
+    """
+    Watch a folder and run every workbook dropped into it, until interrupted.
+
+    A workbook is picked up once its size and modified time stop changing between two polls. Finished workbooks and
+    their result files are moved to the processed folder, failed ones to the failed folder. Files that can't be moved
+    yet, such as workbooks still open in Excel, are moved on a later poll without running them again. The directory
+    cache is kept between jobs and cleared once it is older than the maximum cache age. Errors reading the folder are
+    reported and the folder is read again on the next poll.
+    """
+    console.print(f"Watching {args.folder} for {TOOL_COMMANDS[args.tool]} workbooks...", style="bold green")
+    last_seen = {}
+    pending_moves = {}
+    cache_started = time.monotonic()
+    while True:
+        if args.max_cache_age and time.monotonic() - cache_started > args.max_cache_age:
+            directory_cache.clear()
+            cache_started = time.monotonic()
+
+        for file_path, folder_name in list(pending_moves.items()):
+            try:
+                _move_job_files(file_path, folder_name)
+                del pending_moves[file_path]
+            except OSError as e:
+                console.print(f"{os.path.basename(file_path)}: couldn't move to {folder_name} - {e}", style="bold red")
+
+        ready = []
+        seen = {}
+        read_failed = False
+        try:
+            for entry in os.scandir(args.folder):
+                if not entry.is_file() or not _is_workbook(entry.name) or entry.path in pending_moves:
+                    continue
+                stat_result = entry.stat()
+                seen[entry.path] = (stat_result.st_size, stat_result.st_mtime)
+                # Wait for the file to finish being written before picking it up
+                if last_seen.get(entry.path) == seen[entry.path]:
+                    ready.append(entry.path)
+        except OSError as e:
+            # The network folder can drop for a moment - Try again on the next poll
+            console.print(f"Couldn't read {args.folder} - {e}", style="bold red")
+            ready = []
+            read_failed = True
+        last_seen = seen
+
+        for file_path in sorted(ready):
+            last_seen.pop(file_path, None)
+            start = time.perf_counter()
+            try:
+                result = run_job(args, file_path, directory_cache)
+            except Exception as e:
+                result = f"error - {e}"
+            folder_name = WATCH_PROCESSED_FOLDER_NAME if result == "success" else WATCH_FAILED_FOLDER_NAME
+            console.print(f"{os.path.basename(file_path)}: {result} ({time.perf_counter() - start:.2f}s)",
+                          style="bold green" if result == "success" else "bold red")
+            try:
+                _move_job_files(file_path, folder_name)
+            except OSError as e:
+                pending_moves[file_path] = folder_name
+                console.print(f"{os.path.basename(file_path)}: couldn't move to {folder_name} - {e}", style="bold red")
+
+        if args.once and not last_seen and not read_failed and not pending_moves:
+            return
+        time.sleep(args.poll_seconds)
+
+
+def run_index(args, console: Console) -> int:
+    """
+    Bring a CMS index up to date, re-listing the indexed folders that changed and indexing the given folders.
+
+    :return: The exit code, 1 if a folder couldn't be indexed and 0 otherwise.
+    """
+    from cms_index import CMSIndex
+
+    cms_index = CMSIndex(args.index_file)
+    try:
+        start = time.perf_counter()
+        console.print(f"Re-listed {cms_index.refresh()} changed folders ({time.perf_counter() - start:.2f}s)")
+        failed = False
+        for top in args.top:
+            start = time.perf_counter()
+            if not os.path.isdir(top):
+                failed = True
+                console.print(f"{top}: not a folder", style="bold red")
+                continue
+            indexed = cms_index.index_tree(top, args.depth)
+            console.print(f"{top}: indexed {indexed} folders ({time.perf_counter() - start:.2f}s)")
+    finally:
+        cms_index.close()
+    return 1 if failed else 0
+
+
+def run_self_check(console: Console) -> int:
+    """
+    Check that the modules the tools load lazily are available and can write and read a workbook.
+
+    Packaged builds run this after they are built, so a bundle with missing libraries is caught before it is handed
+    out rather than when a user first runs a tool.
+
+    :return: The exit code, 1 if any check failed and 0 otherwise.
+    """
+    import importlib
+    import tempfile
+    from enums import CMSSubmissionsFileExcelColumns
+    from workbook_io import ResultWriter, read_header
+
+    failed = False
+    for module_name in ["openpyxl", "rich.prompt", "sqlite3", "asyncio", "staged_pipeline", "cms_index", "hash_cache"]:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+            console.print(f"{module_name}: ok ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        except Exception as e:
+            failed = True
+            console.print(f"{module_name}: {e}", style="bold red")
+
+    try:
+        import openpyxl
+        with tempfile.TemporaryDirectory() as temp_path:
+            file_path = os.path.join(temp_path, "selfCheck.xlsx")
+            with ResultWriter(file_path, [CMSSubmissionsFileExcelColumns.SUBMISSION]) as writer:
+                writer.append(("123456",))
+            wb = openpyxl.load_workbook(file_path, read_only=True)
+            header = read_header(wb.active)
+            wb.close()
+        if header != (CMSSubmissionsFileExcelColumns.SUBMISSION.value,):
+            raise ValueError(f"read back {header}")
+        console.print("workbook: ok")
+    except Exception as e:
+        failed = True
+        console.print(f"workbook: {e}", style="bold red")
+
+    console.print("Self-check failed" if failed else "Self-check passed", style="bold red" if failed else "bold green")
+    return 1 if failed else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run the CMS Automation Tool without prompts.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_tool_arguments(subparser):
+        subparser.add_argument("--path-type", choices=CMSPathTypes.get_values(), default=CMSPathTypes.PRODUCT.value,
+                               help="Type of CMS path to build.")
+        subparser.add_argument("--workers", type=int, default=1, help="Number of rows to work on at the same time.")
+        subparser.add_argument("--streaming", action="store_true",
+                               help="Stream the rows and write the results to a side file.")
+        subparser.add_argument("--create-missing-paths", action="store_true",
+                               help="Create destination folders that don't exist in the CMS.")
+        subparser.add_argument("--resume", action="store_true",
+                               help="Skip the rows the journal confirms were already uploaded.")
+        subparser.add_argument("--verify", action="store_true", help="Checksum and verify each copied file.")
+        subparser.add_argument("--compare-mode", choices=CMSCompareModes.get_values(),
+                               default=CMSCompareModes.NAME.value,
+                               help="How to decide if an existing destination file is up to date.")
+        subparser.add_argument("--instrument", action="store_true", help="Report file system call counts and timings.")
+        subparser.add_argument("--no-log", action="store_true", help="Don't write a log file.")
+        subparser.add_argument("--structured-log", help="JSONL file to write one record per uploaded row to.")
+        subparser.add_argument("--no-progress", action="store_true", help="Don't show the progress display.")
+        subparser.add_argument("--plan", action="store_true",
+                               help="Plan the whole sheet first and copy grouped by destination folder.")
+        subparser.add_argument("--dry-run", action="store_true", help="Print the copy plan without copying anything.")
+        subparser.add_argument("--index", help="CMS index file to read the Path Builder's folder listings from.")
+        subparser.add_argument("--verify-index", action="store_true",
+                               help="Check paths resolved from the index against the share.")
+        subparser.add_argument("--incremental", action="store_true",
+                               help="Keep the destinations that are still valid and only build new, blank and stale "
+                                    "rows.")
+        subparser.add_argument("--adaptive", action="store_true",
+                               help="Retry transient errors, adapt the copies in flight and pause if the share drops.")
+
+    for command in TOOL_COMMANDS:
+        subparser = subparsers.add_parser(command, help=f"Run the {TOOL_COMMANDS[command]} on one or more workbooks.")
+        subparser.add_argument("files", nargs="+", help="Workbooks or glob patterns to run.")
+        add_tool_arguments(subparser)
+
+    watch_parser = subparsers.add_parser("watch", help="Run every workbook dropped into a folder.")
+    watch_parser.add_argument("folder", help="Folder to watch.")
+    watch_parser.add_argument("--tool", choices=list(TOOL_COMMANDS), default="path-builder",
+                              help="Tool to run the workbooks through.")
+    watch_parser.add_argument("--poll-seconds", type=float, default=WATCH_POLL_SECONDS,
+                              help="Seconds between checks of the folder.")
+    watch_parser.add_argument("--max-cache-age", type=float, default=WATCH_MAX_CACHE_AGE_SECONDS,
+                              help="Seconds to keep directory listings between jobs before listing the folders "
+                                   "again. 0 keeps them until exit.")
+    watch_parser.add_argument("--once", action="store_true",
+                              help="Exit once the workbooks in the folder have been run and moved.")
+    add_tool_arguments(watch_parser)
+
+    index_parser = subparsers.add_parser("index", help="Re-list the changed folders of a CMS index and index folders.")
+    index_parser.add_argument("index_file", help="CMS index file. It is created if it doesn't exist.")
+    index_parser.add_argument("--top", nargs="*", default=[],
+                              help="Folders to index, such as the Application Workbooks folder.")
+    index_parser.add_argument("--depth", type=int, default=INDEX_TREE_DEPTH,
+                              help="How many levels of sub folders to index below each folder.")
+
+    subparsers.add_parser("self-check", help="Check that the tool's libraries load and exit.")
+    return parser
+
+
+def main(argv: list = None) -> int:
+    args = build_parser().parse_args(argv)
+    console = Console()
+    if args.command == "self-check":
+        return run_self_check(console)
+    if args.command == "index":
+        return run_index(args, console)
+
+    # One cache for the whole process, so later jobs start with the listings earlier jobs read
+    directory_cache = DirectoryCache()
+
+    if args.command == "watch":
+        try:
+            run_watch(args, directory_cache, console)
+        except KeyboardInterrupt:
+            console.print("Exiting...", style="bold red")
+        return 0
+
+    args.tool = args.command
+    return run_batch(args, directory_cache, console)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import os
+import sqlite3
+import threading
+
+
+class CMSIndex:
+    """
+    Persistent on-disk snapshot of CMS directory listings stored in a SQLite file.
+
+    Listings are recorded the first time a directory is read and are served from the index afterwards, so lookups
+    only stat the directory on the share instead of listing it. A directory whose mtime has changed since it was
+    recorded is listed again. Call refresh to re-list every changed directory up front.
+    """
+
+    def __init__(self, index_file_path: str, verify_on_hit: bool = False):
+        """
+        :param index_file_path: The path of the SQLite index file. It is created if it doesn't exist.
+        :param verify_on_hit: A boolean indicating whether resolved paths found in the index should be checked against
+            the file system before they are used.
+        """
+        self.index_file_path = index_file_path
+        self.verify_on_hit = verify_on_hit
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(index_file_path, check_same_thread=False)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                parent TEXT NOT NULL,
+                name TEXT NOT NULL,
+                is_dir INTEGER NOT NULL,
+                PRIMARY KEY (parent, name)
+            );
+        """)
+        self._connection.commit()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        # Absolute, so folders indexed from a relative path match the Path Builder's lookups
+        return os.path.normcase(os.path.abspath(path))
+
+    def _store(self, path: str) -> list:
+        """
+        List a directory on the file system and record it in the index.
+
+        :param path: The path of the directory.
+
+        :return: A list of (entry name, is directory) tuples.
+        """
+        mtime = os.stat(path).st_mtime
+        with os.scandir(path) as it:
+            entries = [(entry.name, entry.is_dir()) for entry in it]
+
+        key = self._key(path)
+        with self._lock:
+            self._connection.execute("DELETE FROM entries WHERE parent = ?", (key,))
+            self._connection.executemany("INSERT INTO entries (parent, name, is_dir) VALUES (?, ?, ?)",
+                                         [(key, name, int(is_dir)) for name, is_dir in entries])
+            self._connection.execute("INSERT OR REPLACE INTO directories (path, mtime) VALUES (?, ?)", (key, mtime))
+            self._connection.commit()
+        return entries
+
+    def list_dir(self, path: str) -> list:
+        """
+        Get the listing of a directory from the index, reading and recording it if it hasn't been indexed yet or its
+        mtime has changed since it was recorded.
+
+        :param path: The path of the directory.
+
+        :return: A list of (entry name, is directory) tuples.
+
+        :raises FileNotFoundError: If the directory no longer exists. Its recorded listing is dropped.
+        """
+        key = self._key(path)
+        with self._lock:
+            indexed = self._connection.execute("SELECT mtime FROM directories WHERE path = ?", (key,)).fetchone()
+        if indexed is None:
+            return self._store(path)
+
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._forget(key)
+            raise
+        # Entries were added, removed or renamed since the listing was recorded
+        if mtime != indexed[0]:
+            return self._store(path)
+
+        with self._lock:
+            rows = self._connection.execute("SELECT name, is_dir FROM entries WHERE parent = ? ORDER BY rowid",
+                                            (key,)).fetchall()
+        return [(name, bool(is_dir)) for name, is_dir in rows]
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM directories WHERE path = ?", (key,))
+            self._connection.execute("DELETE FROM entries WHERE parent = ?", (key,))
+            self._connection.commit()
+
+    def contains(self, path: str) -> bool:
+        """
+        Check if the index records a path as an existing directory.
+
+        :param path: The path to check.
+
+        :return: True if the path is an indexed directory or a directory entry of one, False otherwise.
+        """
+        parent, name = os.path.split(os.path.normpath(path))
+        with self._lock:
+            if self._connection.execute("SELECT 1 FROM directories WHERE path = ?",
+                                        (self._key(path),)).fetchone() is not None:
+                return True
+            rows = self._connection.execute("SELECT name FROM entries WHERE parent = ? AND is_dir = 1",
+                                            (self._key(parent),)).fetchall()
+        name = os.path.normcase(name)
+        return any(os.path.normcase(entry) == name for entry, in rows)
+
+    def verify(self, path: str) -> bool:
+        """
+        Confirm that the deepest folder of a resolved path that the index records as existing is still on the file
+        system.
+
+        Stale listings are dropped so the next lookup reads the live folders again.
+
+        :param path: The resolved path to verify.
+
+        :return: False if the index recorded the folder but it no longer exists, True otherwise.
+        """
+        current = os.path.normpath(path)
+        while not self.contains(current):
+            parent = os.path.dirname(current)
+            if parent == current:
+                return True
+            current = parent
+        if os.path.isdir(current):
+            return True
+        self.invalidate(current)
+        return False
+
+    def invalidate(self, path: str):
+        """
+        Drop the recorded listings of a path and every one of its ancestors.
+
+        :param path: The path that was created, removed or changed.
+        """
+        path = os.path.normpath(path)
+        with self._lock:
+            while True:
+                key = self._key(path)
+                self._connection.execute("DELETE FROM directories WHERE path = ?", (key,))
+                self._connection.execute("DELETE FROM entries WHERE parent = ?", (key,))
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+            self._connection.commit()
+
+    def refresh(self, top: str = None) -> int:
+        """
+        Re-list the indexed directories whose mtime has changed since they were recorded.
+
+        Directories that no longer exist are removed from the index.
+
+        :param top: (Optional) Only refresh directories under this path. Default is every indexed directory.
+
+        :return: The number of directories that were re-listed.
+        """
+        with self._lock:
+            directories = self._connection.execute("SELECT path, mtime FROM directories").fetchall()
+
+        if top is not None:
+            top_key = self._key(top)
+            directories = [(path, mtime) for path, mtime in directories if
+                           path == top_key or path.startswith(top_key.rstrip(os.sep) + os.sep)]
+
+        refreshed = 0
+        for path, mtime in directories:
+            try:
+                current_mtime = os.stat(path).st_mtime
+            except FileNotFoundError:
+                self._forget(path)
+                continue
+            if current_mtime != mtime:
+                self._store(path)
+                refreshed += 1
+        return refreshed
+
+    def index_tree(self, top: str, max_depth: int) -> int:
+        """
+        Record the listings of a folder and its sub folders down to a given depth.
+
+        For example, indexing the Application Workbooks or Submissions folder with a depth of 4 records the range
+        folders, the product folders and their submission folders.
+
+        :param top: The path of the folder to index.
+        :param max_depth: How many levels of sub folders to index below the folder.
+
+        :return: The number of directories that were indexed.
+        """
+        indexed = 0
+        level = [top]
+        for depth in range(max_depth + 1):
+            next_level = []
+            for path in level:
+                try:
+                    entries = self.list_dir(path)
+                except OSError:
+                    continue
+                indexed += 1
+                if depth < max_depth:
+                    next_level.extend(os.path.join(path, name) for name, is_dir in entries if is_dir)
+            level = next_level
+        return indexed
+
+    def close(self):
+        """
+        Close the index file.
+        """
+        with self._lock:
+            self._connection.close()
@@ -1,9 +1,34 @@
-DRIVE_LETTER = "Z:\\"
-CMS_FOLDER = "NHP-OS - SD-PSN"
+import os
+
+# The CMS root and the VPN check path can be overridden to point the tools at a local copy of the CMS tree
+DRIVE_LETTER = os.environ.get("CMS_DRIVE_LETTER", "Z:\\")
+CMS_FOLDER = os.environ.get("CMS_FOLDER", "NHP-OS - SD-PSN")
+VPN_CHECK_PATH = os.environ.get("CMS_VPN_CHECK_PATH", "Y:\\HC")
 APPLICATION_WORKBOOKS = "Application Workbooks"
 SUBMISSIONS = "Submissions"
 SITE_SUBMISSIONS = "Site Submissions"
 COMPANY_UPDATES = "Company Updates (HC6-4)"
 MASTER_FILES = "Master Files (HC6-24)"
 TRADING_PARTNER_FILES = "Trading Partner (GC8-5)"
-POST_LICENCE_FOLDER_NAME = "Post Licence"
\ No newline at end of file
+POST_LICENCE_FOLDER_NAME = "Post Licence"
+STREAMING_CHUNK_SIZE = 1000
+MTIME_TOLERANCE_SECONDS = 2
+HASH_CACHE_FILE_NAME = "bulkUploaderHashes.db"
+PATH_BUILDER_REPORT_FILE_NAME = "pathBuilderReport.json"
+BULK_UPLOADER_REPORT_FILE_NAME = "bulkUploaderReport.json"
+SUBMISSION_SEARCH_MAX_DEPTH = 3
+PIPELINE_QUEUE_SIZE = 100
+PIPELINE_READ_CHUNK_SIZE = 50
+PIPELINE_LOG_FILE_NAME = "cmsPipeline.log"
+WATCH_POLL_SECONDS = 5
+WATCH_PROCESSED_FOLDER_NAME = "processed"
+WATCH_FAILED_FOLDER_NAME = "failed"
+BULK_UPLOADER_LOG_FILE_NAME = "bulkUploader.log"
+PROGRESS_REFRESH_SECONDS = 0.25
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 30
+SHARE_PAUSE_TIMEOUT_SECONDS = 1800
+SHARE_POLL_SECONDS = 10
+INDEX_TREE_DEPTH = 4
+WATCH_MAX_CACHE_AGE_SECONDS = 300
\ No newline at end of file
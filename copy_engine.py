@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class CopyEngine:
+    """
+    Runs bulk upload rows on a thread pool while reporting their results in row order.
+
+    Rows that work on the same destination should hold its destination lock while checking for and creating it, so two
+    workers never race on the same os.makedirs or copy the same file twice.
+    """
+
+    def __init__(self, max_workers: int = 1):
+        """
+        :param max_workers: The number of rows to work on at the same time. 1 runs the rows one after another.
+        """
+        self.max_workers = max(1, max_workers)
+        self._destination_locks = {}
+        self._locks_lock = threading.Lock()
+
+    @contextmanager
+    def destination_lock(self, destination: str):
+        """
+        Hold the lock for a destination folder or file.
+
+        Locks are only kept while a row holds or waits for them, so a long sheet doesn't keep one for every destination
+        it has copied to.
+
+        :param destination: The path of the destination folder or file.
+        """
+        key = os.path.normcase(os.path.normpath(str(destination)))
+        with self._locks_lock:
+            entry = self._destination_locks.get(key)
+            if entry is None:
+                entry = self._destination_locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._destination_locks[key]
+
+    def run(self, rows, upload_row):
+        """
+        Run a function over every row, yielding the results in the same order as the rows.
+
+        Rows are pulled from the iterable only as workers free up, so a streamed sheet is never read into memory all at
+        once.
+
+        :param rows: An iterable of rows from the submissions file.
+        :param upload_row: The function that handles a single row and returns its result.
+
+        :return: A generator of the results of upload_row for each row.
+        """
+        if self.max_workers == 1:
+            for row in rows:
+                yield upload_row(row)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for row in rows:
+                pending.append(executor.submit(upload_row, row))
+                if len(pending) >= self.max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
@@ -0,0 +1,191 @@
+import os
+import threading
+from directory_cache import DirectoryCache
+
+
+class PlannedDestination:
+    """
+    A destination folder of a copy plan and the rows copying to it.
+    """
+
+    def __init__(self, path: str, exists: bool):
+        """
+        :param path: The path of the destination folder.
+        :param exists: A boolean indicating whether the folder existed when the plan was compiled.
+        """
+        self.path = path
+        self.exists = exists
+        self.existing_files = set()
+        self.rows = []
+        self.files = 0
+        self.bytes = 0
+        self.already_there = 0
+
+
+class CopyPlan:
+    """
+    Execution plan for a whole Bulk Uploader sheet, compiled before anything is copied.
+
+    Each distinct destination folder is looked up once, in a single listing of its parent folder, and each existing
+    destination folder is listed once to find the files already in it. While the plan runs, rows ask it whether their
+    folder and file exist instead of checking the share, and each missing folder is created exactly once.
+    """
+
+    def __init__(self, destinations: dict, empty_rows: list, error_rows: list = None):
+        """
+        :param destinations: The PlannedDestination of each destination folder, keyed by its normalised path.
+        :param empty_rows: The (row number, row) tuples of the rows without a destination.
+        :param error_rows: (Optional) The (row number, row, error) tuples of the rows that couldn't be planned, such as
+            rows without a source.
+        """
+        self.destinations = destinations
+        self.empty_rows = empty_rows
+        self.error_rows = error_rows if error_rows is not None else []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.normpath(path))
+
+    @classmethod
+    def compile(cls, numbered_rows) -> "CopyPlan":
+        """
+        Read every row and work out what each destination folder needs.
+
+        :param numbered_rows: An iterable of (row number, row) tuples, where each row holds the Submission, Source and
+            Destination values.
+
+        :return: The compiled plan.
+        """
+        listings = DirectoryCache()
+        destinations = {}
+        planned_files = set()
+        empty_rows = []
+        error_rows = []
+
+        for row_number, row in numbered_rows:
+            if row[2] is None:
+                empty_rows.append((row_number, row))
+                continue
+
+            try:
+                key = cls._key(row[2])
+                file_name = os.path.normcase(os.path.basename(row[1]))
+            except (TypeError, ValueError) as e:
+                # Leave the row to fail on its own when it runs rather than failing the whole plan
+                error_rows.append((row_number, row, str(e)))
+                continue
+
+            destination = destinations.get(key)
+            if destination is None:
+                destination = PlannedDestination(row[2], cls._folder_exists(listings, row[2]))
+                if destination.exists:
+                    try:
+                        destination.existing_files = {os.path.normcase(name) for name, is_dir in
+                                                      listings.list_dir(row[2]) if not is_dir}
+                    except OSError:
+                        pass
+                destinations[key] = destination
+
+            destination.rows.append((row_number, row))
+            # Later rows for a file an earlier row copies will find it there
+            if file_name in destination.existing_files or (key, file_name) in planned_files:
+                destination.already_there += 1
+                continue
+            planned_files.add((key, file_name))
+            destination.files += 1
+            try:
+                destination.bytes += os.stat(row[1]).st_size
+            except OSError:
+                pass
+        return cls(destinations, empty_rows, error_rows)
+
+    @classmethod
+    def _folder_exists(cls, listings: DirectoryCache, path: str) -> bool:
+        path = os.path.normpath(path)
+        parent, name = os.path.split(path)
+        if not name or parent == path:
+            return os.path.isdir(path)
+        try:
+            # Destinations that share a parent are all answered by the same listing
+            return any(is_dir and os.path.normcase(entry) == os.path.normcase(name)
+                       for entry, is_dir in listings.list_dir(parent))
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return os.path.isdir(path)
+
+    def ordered_rows(self) -> list:
+        """
+        Get the rows in the order to run them, grouped and sorted by destination folder.
+
+        :return: A list of (row number, row) tuples.
+        """
+        rows = list(self.empty_rows) + [(row_number, row) for row_number, row, _ in self.error_rows]
+        for key in sorted(self.destinations):
+            rows.extend(self.destinations[key].rows)
+        return rows
+
+    def folder_exists(self, path: str) -> bool:
+        """
+        Check if a destination folder of the plan exists.
+        """
+        with self._lock:
+            return self.destinations[self._key(path)].exists
+
+    def file_exists(self, path: str, file_name: str) -> bool:
+        """
+        Check if a file exists in a destination folder of the plan.
+        """
+        with self._lock:
+            return os.path.normcase(file_name) in self.destinations[self._key(path)].existing_files
+
+    def create_folder(self, path: str, directory_cache: DirectoryCache = None):
+        """
+        Create a missing destination folder of the plan.
+
+        :param path: The path of the destination folder.
+        :param directory_cache: (Optional) The directory listing cache of the run, whose listings of the folder's
+            parents are invalidated as soon as it is created.
+        """
+        if directory_cache is not None:
+            directory_cache.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self.destinations[self._key(path)].exists = True
+
+    def record_file(self, path: str, file_name: str):
+        """
+        Record that a file was copied to a destination folder of the plan.
+        """
+        with self._lock:
+            self.destinations[self._key(path)].existing_files.add(os.path.normcase(file_name))
+
+    def summary_lines(self, create_missing_paths: bool) -> list:
+        """
+        Describe the plan for a dry run.
+
+        :param create_missing_paths: A boolean indicating whether missing destination folders would be created.
+
+        :return: A list of lines, a summary followed by one line per destination folder in execution order.
+        """
+        destinations = [self.destinations[key] for key in sorted(self.destinations)]
+        missing = [destination for destination in destinations if not destination.exists]
+        rows = len(self.empty_rows) + len(self.error_rows) + sum(len(destination.rows) for destination in destinations)
+        lines = [f"Plan for {rows} rows: {len(destinations)} destination folders, {len(missing)} missing"
+                 f"{' (will be created)' if create_missing_paths else ' (rows will be skipped)'}, "
+                 f"{sum(destination.files for destination in destinations)} files to copy, "
+                 f"{sum(destination.bytes for destination in destinations) / (1024 * 1024):.2f} MB, "
+                 f"{sum(destination.already_there for destination in destinations)} already at the destination, "
+                 f"{len(self.empty_rows)} without a destination, {len(self.error_rows)} that can't be planned"]
+        for row_number, row, error in self.error_rows:
+            lines.append(f"  Error: row {row_number} - {error}")
+        for destination in destinations:
+            if destination.exists:
+                action = "Exists"
+            else:
+                action = "Create" if create_missing_paths else "Missing"
+            lines.append(f"  {action}: {destination.path} - {destination.files} files, "
+                         f"{destination.bytes / (1024 * 1024):.2f} MB, {destination.already_there} already there")
+        return lines
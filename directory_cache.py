@@ -0,0 +1,151 @@
+import os
+import threading
+from collections import OrderedDict
+from folder_name_index import FolderNameIndex
+
+
+class DirectoryCache:
+    """
+    Run-scoped LRU cache of directory listings.
+
+    Each listing is stored as a list of (entry name, is directory) tuples keyed by the normalised directory path, so
+    repeated lookups in the same CMS range folder only hit the share once.
+    """
+
+    def __init__(self, max_entries: int = 1024, source=None):
+        """
+        :param max_entries: The maximum number of directory listings to keep before evicting the least recently used.
+        :param source: (Optional) An object with list_dir and invalidate methods to read listings from instead of the
+            file system, such as a CMSIndex.
+        """
+        self.max_entries = max_entries
+        self.source = source
+        self.hits = 0
+        self.misses = 0
+        self._listings = OrderedDict()
+        self._name_indexes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.normpath(path))
+
+    def list_dir(self, path: str) -> list:
+        """
+        Get the listing of a directory, reading it from the file system only if it isn't cached.
+
+        :param path: The path of the directory.
+
+        :return: A list of (entry name, is directory) tuples.
+        """
+        key = self._key(path)
+        with self._lock:
+            if key in self._listings:
+                self._listings.move_to_end(key)
+                self.hits += 1
+                return self._listings[key]
+
+        entries = self._read_dir(path)
+
+        with self._lock:
+            self.misses += 1
+            self._listings[key] = entries
+            self._listings.move_to_end(key)
+            while len(self._listings) > self.max_entries:
+                evicted_key, _ = self._listings.popitem(last=False)
+                self._name_indexes.pop(evicted_key, None)
+        return entries
+
+    def _read_dir(self, path: str) -> list:
+        if self.source is not None:
+            return self.source.list_dir(path)
+        with os.scandir(path) as it:
+            return [(entry.name, entry.is_dir()) for entry in it]
+
+    def list_sub_folders(self, path: str) -> list:
+        """
+        Get the names of the sub folders of a directory.
+
+        :param path: The path of the directory.
+
+        :return: A list of sub folder names.
+        """
+        return [name for name, is_dir in self.list_dir(path) if is_dir]
+
+    def name_index(self, path: str) -> FolderNameIndex:
+        """
+        Get the index of the 6-digit numbers in the sub folder names of a directory, built once per cached listing.
+
+        :param path: The path of the directory.
+
+        :return: The FolderNameIndex of the directory's sub folders.
+        """
+        entries = self.list_dir(path)
+        key = self._key(path)
+        with self._lock:
+            indexed = self._name_indexes.get(key)
+        # Rebuild the index if the listing was read again since it was built
+        if indexed is not None and indexed[0] is entries:
+            return indexed[1]
+        index = FolderNameIndex([name for name, is_dir in entries if is_dir])
+        with self._lock:
+            if key in self._listings:
+                self._name_indexes[key] = (entries, index)
+        return index
+
+    def is_dir(self, path: str) -> bool:
+        """
+        Check if a path is a directory, using the cached listing of its parent when there is one.
+
+        :param path: The path to check.
+
+        :return: True if the path is a directory, False otherwise.
+        """
+        parent, name = os.path.split(os.path.normpath(path))
+        with self._lock:
+            entries = self._listings.get(self._key(parent))
+        if entries is None:
+            return os.path.isdir(path)
+        name = os.path.normcase(name)
+        return any(is_dir for entry, is_dir in entries if os.path.normcase(entry) == name)
+
+    def invalidate(self, path: str):
+        """
+        Drop the cached listings of a path and every one of its ancestors.
+
+        Call this after creating something under the path so the next lookup sees the new entry.
+
+        :param path: The path that was created or changed.
+        """
+        current = os.path.normpath(path)
+        with self._lock:
+            while True:
+                self._listings.pop(self._key(current), None)
+                self._name_indexes.pop(self._key(current), None)
+                parent = os.path.dirname(current)
+                if parent == current:
+                    break
+                current = parent
+        if self.source is not None:
+            self.source.invalidate(path)
+
+    def makedirs(self, path: str, exist_ok: bool = False):
+        """
+        Create a directory and its missing parents, invalidating the affected listings.
+
+        :param path: The path of the directory to create.
+        :param exist_ok: A boolean indicating whether an existing directory is not an error.
+        """
+        try:
+            os.makedirs(path, exist_ok=exist_ok)
+        finally:
+            # Some of the parents may have been created even if the call failed
+            self.invalidate(path)
+
+    def clear(self):
+        """
+        Drop every cached listing.
+        """
+        with self._lock:
+            self._listings.clear()
+            self._name_indexes.clear()
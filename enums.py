@@ -32,11 +32,16 @@ class CMSPathTypes(Enum):
     def get_values(cls):
         return [member.value for member in cls]
 
+    @classmethod
+    def get_product_values(cls):
+        return [cls.PRODUCT.value, cls.PRODUCT_POST_LICENCE_FOLDER.value]
+
 
 class CMSSubmissionsFileExcelColumns(Enum):
     SUBMISSION = "Submission"
     SOURCE = "Source"
     DESTINATION = "Destination"
+    RESULT = "Result"
 
     @classmethod
     def get_values(cls):
@@ -46,8 +51,37 @@ class CMSSubmissionsFileExcelColumns(Enum):
 class CMSTools(Enum):
     PATH_BUILDER = "Path Builder"
     BULK_UPLOADER = "Bulk Uploader"
+    PIPELINE = "Path Builder and Bulk Uploader"
+
+    @classmethod
+    def get_values(cls):
+        return [member.value for member in cls]
+
+
+class CMSUploadOutcomes(Enum):
+    COPIED = "Copied"
+    CREATED = "Created"
+    EXISTS = "Exists"
+    UPDATED = "Updated"
+    EMPTY_DESTINATION = "Empty Destination"
+    MISSING_PATH = "Missing Path"
+    ERROR = "Error"
+    RESUMED = "Resumed"
 
     @classmethod
     def get_values(cls):
         return [member.value for member in cls]
 
+    @classmethod
+    def get_confirmed_values(cls):
+        return [cls.COPIED.value, cls.CREATED.value, cls.EXISTS.value, cls.UPDATED.value]
+
+
+class CMSCompareModes(Enum):
+    NAME = "Name"
+    SIZE_AND_MTIME = "Size and Modified Time"
+    CONTENT = "Content"
+
+    @classmethod
+    def get_values(cls):
+        return [member.value for member in cls]
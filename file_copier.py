@@ -0,0 +1,192 @@
+import hashlib
+import os
+import shutil
+import time
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024
+PARTIAL_SUFFIX = ".partial"
+
+
+class CopyVerificationError(OSError):
+    """
+    Raised when a copied file doesn't match its source, because fewer bytes were copied than the source holds or the
+    checksums differ.
+    """
+
+
+class CopyResult:
+    """
+    The outcome of copying a single file.
+    """
+
+    def __init__(self, destination: str, bytes_copied: int, seconds: float, checksum: str = None,
+                 verified: bool = False):
+        """
+        :param destination: The path of the copied file.
+        :param bytes_copied: The number of bytes copied.
+        :param seconds: How long the copy took.
+        :param checksum: (Optional) The checksum of the source file, computed while copying.
+        :param verified: A boolean indicating whether the destination was re-read and matched the checksum.
+        """
+        self.destination = destination
+        self.bytes_copied = bytes_copied
+        self.seconds = seconds
+        self.checksum = checksum
+        self.verified = verified
+
+    @property
+    def throughput(self) -> float:
+        """
+        The copy throughput in megabytes per second.
+        """
+        return self.bytes_copied / (1024 * 1024) / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        return f"Copied {self.bytes_copied / (1024 * 1024):.2f} MB in {self.seconds:.2f}s ({self.throughput:.2f} MB/s)"
+
+
+class FileCopier:
+    """
+    Copies files with a tunable buffer size, zero-copy system calls where available and optional integrity checks.
+
+    Without a checksum the bytes are copied in the kernel with os.copy_file_range or os.sendfile when the platform
+    supports them. With a checksum the file is read in large chunks and hashed in the same pass, since zero-copy calls
+    never bring the bytes into Python.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, checksum: bool = False, verify: bool = False,
+                 algorithm: str = "sha256", on_progress=None):
+        """
+        :param buffer_size: The number of bytes to copy per read or system call.
+        :param checksum: A boolean indicating whether to compute a checksum of the source while copying.
+        :param verify: A boolean indicating whether to re-read the destination and compare its checksum. Implies
+            checksum.
+        :param algorithm: The hashlib algorithm to use for checksums.
+        :param on_progress: (Optional) A function called with the destination path, the bytes copied so far and the
+            total size of the file after every chunk.
+        """
+        self.buffer_size = buffer_size
+        self.checksum = checksum or verify
+        self.verify = verify
+        self.algorithm = algorithm
+        self.on_progress = on_progress
+
+    def copy(self, source: str, destination: str) -> CopyResult:
+        """
+        Copy a file and its metadata, like shutil.copy2, replacing the destination file if it exists.
+
+        :param source: The path of the file to copy.
+        :param destination: The destination folder or file path.
+
+        :return: A CopyResult describing the copy.
+        """
+        if os.path.isdir(destination):
+            destination = os.path.join(destination, os.path.basename(source))
+
+        # Copy to a partial file first so an interrupted copy never replaces or looks like a complete file
+        partial_destination = destination + PARTIAL_SUFFIX
+        start = time.perf_counter()
+        try:
+            with open(source, "rb") as source_file, open(partial_destination, "wb") as destination_file:
+                total = os.fstat(source_file.fileno()).st_size
+                if self.checksum:
+                    checksum, bytes_copied = self._copy_chunked(source_file, destination_file, destination, total)
+                else:
+                    checksum = None
+                    bytes_copied = self._copy_zero_copy(source_file, destination_file, destination, total)
+            # Never put a short copy in place, even when it isn't verified
+            if bytes_copied != total:
+                raise CopyVerificationError(f"Copied {bytes_copied} of the {total} bytes of {source} to {destination}")
+            shutil.copystat(source, partial_destination)
+            seconds = time.perf_counter() - start
+
+            verified = False
+            if self.verify:
+                if self.file_checksum(partial_destination) != checksum:
+                    raise CopyVerificationError(f"Checksum of {destination} doesn't match {source}")
+                verified = True
+
+            os.replace(partial_destination, destination)
+        except BaseException:
+            if os.path.exists(partial_destination):
+                os.remove(partial_destination)
+            raise
+
+        return CopyResult(destination, bytes_copied, seconds, checksum, verified)
+
+    def _copy_chunked(self, source_file, destination_file, destination: str, total: int) -> tuple:
+        digest = hashlib.new(self.algorithm)
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        copied = 0
+        while True:
+            read = source_file.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            destination_file.write(view[:read])
+            copied += read
+            self._report(destination, copied, total)
+        return digest.hexdigest(), copied
+
+    def _copy_zero_copy(self, source_file, destination_file, destination: str, total: int) -> int:
+        source_fd = source_file.fileno()
+        destination_fd = destination_file.fileno()
+        copied = 0
+        for system_call in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if system_call is None:
+                continue
+            try:
+                # sendfile writes at the destination's file position, so keep it in step with what was copied
+                os.lseek(destination_fd, copied, os.SEEK_SET)
+                while copied < total:
+                    if system_call is os.sendfile:
+                        sent = os.sendfile(destination_fd, source_fd, copied, min(self.buffer_size, total - copied))
+                    else:
+                        sent = os.copy_file_range(source_fd, destination_fd, min(self.buffer_size, total - copied),
+                                                  copied, copied)
+                    # Some file systems copy nothing instead of failing - Try the next way of copying
+                    if sent == 0:
+                        break
+                    copied += sent
+                    self._report(destination, copied, total)
+            except OSError:
+                # Not supported between these file systems - Try the next way of copying from where this one stopped
+                continue
+            if copied >= total:
+                return copied
+
+        # No zero-copy support - Fall back to large chunked reads
+        source_file.seek(copied)
+        destination_file.seek(copied)
+        while True:
+            chunk = source_file.read(self.buffer_size)
+            if not chunk:
+                break
+            destination_file.write(chunk)
+            copied += len(chunk)
+            self._report(destination, copied, total)
+        return copied
+
+    def _report(self, destination: str, copied: int, total: int):
+        if self.on_progress is not None:
+            self.on_progress(destination, copied, total)
+
+    def file_checksum(self, file_path: str) -> str:
+        """
+        Compute the checksum of a file.
+
+        :param file_path: The path of the file.
+
+        :return: The hex digest of the file.
+        """
+        digest = hashlib.new(self.algorithm)
+        buffer = bytearray(self.buffer_size)
+        view = memoryview(buffer)
+        with open(file_path, "rb") as file:
+            while True:
+                read = file.readinto(buffer)
+                if not read:
+                    break
+                digest.update(view[:read])
+        return digest.hexdigest()
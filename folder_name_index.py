@@ -0,0 +1,60 @@
+import re
+from enums import CMSFolders
+
+SIX_DIGIT_RUN_PATTERN = re.compile(r"\d{6,}")
+
+
+class FolderNameIndex:
+    """
+    Inverted index of the 6-digit file and submission numbers in a folder listing.
+
+    Every 6-digit window of every run of digits in a name is indexed, so a lookup matches exactly the names that the
+    old substring test would have matched. The PathFinder exclusion rules are worked out once per name when the index
+    is built.
+    """
+
+    def __init__(self, names: list):
+        """
+        :param names: The folder names of the listing, in listing order.
+        """
+        self.names = names
+        self.has_cms_folder = any(item in name for name in names for item in CMSFolders.get_values())
+        self._by_number = {}
+        for name in names:
+            for number in self._numbers_in(name.lower()):
+                self._by_number.setdefault(number, []).append(self._entry(name, number))
+
+    @staticmethod
+    def _numbers_in(lowered_name: str) -> set:
+        numbers = set()
+        for match in SIX_DIGIT_RUN_PATTERN.finditer(lowered_name):
+            run = match.group()
+            numbers.update(run[start:start + 6] for start in range(len(run) - 5))
+        return numbers
+
+    @staticmethod
+    def _entry(name: str, number: str) -> tuple:
+        """
+        Build the index entry of a name for a number.
+
+        :return: A tuple of the name, whether the number is followed by a ".", " -" or "-" in the name (the number is
+            part of a file or submission number pair rather than the folder's own file number), and whether the name
+            mentions a discussion.
+        """
+        lowered = name.lower()
+        qualified = f"{number}." in lowered or f"{number} -" in lowered or f"{number}-" in lowered
+        return name, qualified, "discussion" in lowered
+
+    def folders(self, number: str) -> list:
+        """
+        Get the folders whose names contain a number.
+
+        :param number: The file or submission number.
+
+        :return: A list of (name, qualified, discussion) entries in listing order.
+        """
+        number = number.lower()
+        if len(number) == 6 and number.isdigit():
+            return self._by_number.get(number, [])
+        # Not a 6-digit number - Fall back to checking every name
+        return [self._entry(name, number) for name in self.names if number in name.lower()]
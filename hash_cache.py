@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import threading
+from file_copier import FileCopier
+
+
+class HashCache:
+    """
+    Local SQLite cache of file content hashes keyed by path, size and modified time.
+
+    A file is only hashed again once its size or modified time changes, so repeated runs don't re-read unchanged
+    multi-GB files.
+    """
+
+    def __init__(self, cache_file_path: str, algorithm: str = "sha256"):
+        """
+        :param cache_file_path: The path of the SQLite cache file. It is created if it doesn't exist.
+        :param algorithm: The hashlib algorithm to hash files with.
+        """
+        self.cache_file_path = cache_file_path
+        self.algorithm = algorithm
+        self._file_copier = FileCopier(algorithm=algorithm)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(cache_file_path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                algorithm TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (path, size, mtime, algorithm)
+            )
+        """)
+        self._connection.commit()
+
+    def get_hash(self, file_path: str, stat_result: os.stat_result = None) -> str:
+        """
+        Get the content hash of a file, hashing it only if it isn't cached for its current size and modified time.
+
+        :param file_path: The path of the file.
+        :param stat_result: (Optional) The result of os.stat for the file, if it was already read.
+
+        :return: The hex digest of the file.
+        """
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+        key = (os.path.normcase(os.path.abspath(file_path)), stat_result.st_size, stat_result.st_mtime, self.algorithm)
+
+        with self._lock:
+            row = self._connection.execute("SELECT hash FROM hashes WHERE path = ? AND size = ? AND mtime = ? AND "
+                                           "algorithm = ?", key).fetchone()
+        if row is not None:
+            return row[0]
+
+        file_hash = self._file_copier.file_checksum(file_path)
+        with self._lock:
+            # Entries for older versions of the file are no longer useful
+            self._connection.execute("DELETE FROM hashes WHERE path = ? AND algorithm = ?", (key[0], self.algorithm))
+            self._connection.execute("INSERT OR REPLACE INTO hashes (path, size, mtime, algorithm, hash) "
+                                     "VALUES (?, ?, ?, ?, ?)", key + (file_hash,))
+            self._connection.commit()
+        return file_hash
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        with self._lock:
+            self._connection.close()
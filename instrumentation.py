@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from file_copier import FileCopier
+
+
+def _percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class RunInstrumentation:
+    """
+    Opt-in counters and timers for the file system calls and rows of a tool run.
+
+    While active, the os and os.path functions the tools use and FileCopier.copy are wrapped process-wide. Only the
+    outermost call is recorded, so os.makedirs counts as one call rather than the stats it makes internally. Calls are
+    attributed to the row the current thread is working on.
+    """
+
+    OS_FUNCTIONS = ["stat", "lstat", "scandir", "listdir", "makedirs", "mkdir", "replace", "remove"]
+    OS_PATH_FUNCTIONS = ["exists", "isdir", "isfile"]
+
+    def __init__(self, enabled: bool = True, slowest_rows: int = 10):
+        """
+        :param enabled: A boolean indicating whether to record anything. A disabled instance does nothing, so callers
+            don't need to check for one.
+        :param slowest_rows: The number of slowest rows to keep in the summary.
+        """
+        self.enabled = enabled
+        self.slowest_rows = slowest_rows
+        self.calls = {}
+        self.rows = []
+        self.bytes_copied = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._originals = []
+        self._start = None
+        self._seconds = 0.0
+
+    def _record_call(self, name: str, seconds: float):
+        with self._lock:
+            count, total = self.calls.get(name, (0, 0.0))
+            self.calls[name] = (count + 1, total + seconds)
+        row = getattr(self._local, "row", None)
+        if row is not None:
+            row["calls"] += 1
+
+    def _wrap(self, name: str, function):
+        def wrapper(*args, **kwargs):
+            # Calls made inside another recorded call are part of it
+            if getattr(self._local, "depth", 0):
+                return function(*args, **kwargs)
+            self._local.depth = 1
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            finally:
+                self._local.depth = 0
+                self._record_call(name, time.perf_counter() - start)
+            if name == "copy":
+                with self._lock:
+                    self.bytes_copied += result.bytes_copied
+            return result
+        return wrapper
+
+    def _patch(self, owner, attribute: str, name: str):
+        original = getattr(owner, attribute)
+        self._originals.append((owner, attribute, original))
+        setattr(owner, attribute, self._wrap(name, original))
+
+    @contextmanager
+    def timed(self, name: str):
+        """
+        Record a block of code, such as loading or saving the workbook, as a call.
+
+        :param name: The name to record the call under.
+        """
+        if not self.enabled:
+            yield
+            return
+        self._local.depth = 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            self._record_call(name, time.perf_counter() - start)
+
+    @contextmanager
+    def row(self, row_number: int, label=None):
+        """
+        Time a row and attribute the file system calls made on the current thread to it.
+
+        :param row_number: The row number in the Excel file.
+        :param label: (Optional) The row's Submission value, to identify it in the summary.
+        """
+        if not self.enabled:
+            yield
+            return
+        row = {"row": row_number, "submission": None if label is None else str(label), "calls": 0, "seconds": 0.0}
+        self._local.row = row
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            row["seconds"] = time.perf_counter() - start
+            self._local.row = None
+            with self._lock:
+                self.rows.append(row)
+
+    def summary(self) -> dict:
+        """
+        Summarise the run.
+
+        :return: A dict with the run time, row latency percentiles, the slowest rows, calls per row, bytes copied and
+            the count and total time of each call.
+        """
+        latencies = sorted(row["seconds"] for row in self.rows)
+        total_calls = sum(count for count, _ in self.calls.values())
+        return {
+            "seconds": self._seconds,
+            "rows": len(self.rows),
+            "row_seconds": {
+                "p50": _percentile(latencies, 50),
+                "p90": _percentile(latencies, 90),
+                "p99": _percentile(latencies, 99),
+                "max": latencies[-1] if latencies else 0.0,
+            },
+            "slowest_rows": sorted(self.rows, key=lambda row: row["seconds"], reverse=True)[:self.slowest_rows],
+            "calls_per_row": sum(row["calls"] for row in self.rows) / len(self.rows) if self.rows else 0.0,
+            "total_calls": total_calls,
+            "bytes_copied": self.bytes_copied,
+            "calls": {name: {"count": count, "seconds": seconds} for name, (count, seconds) in
+                      sorted(self.calls.items(), key=lambda item: item[1][1], reverse=True)},
+        }
+
+    def summary_lines(self) -> list:
+        """
+        Format the summary for the console and log.
+
+        :return: A list of summary lines.
+        """
+        summary = self.summary()
+        row_seconds = summary["row_seconds"]
+        lines = [f"Run took {summary['seconds']:.2f}s for {summary['rows']} rows",
+                 f"Row latency p50 {row_seconds['p50'] * 1000:.1f} ms, p90 {row_seconds['p90'] * 1000:.1f} ms, "
+                 f"p99 {row_seconds['p99'] * 1000:.1f} ms, max {row_seconds['max'] * 1000:.1f} ms",
+                 f"{summary['total_calls']} file system calls, {summary['calls_per_row']:.2f} per row, "
+                 f"{summary['bytes_copied'] / (1024 * 1024):.2f} MB copied"]
+        for name, call in summary["calls"].items():
+            lines.append(f"  {name}: {call['count']} calls, {call['seconds']:.2f}s")
+        for row in summary["slowest_rows"][:5]:
+            lines.append(f"  Slow row {row['row']} ({row['submission']}): {row['seconds'] * 1000:.1f} ms, "
+                         f"{row['calls']} calls")
+        return lines
+
+    def write_report(self, report_file_path: str):
+        """
+        Write the summary to a JSON report file.
+
+        :param report_file_path: The path of the report file.
+        """
+        with open(report_file_path, "w", encoding="utf-8") as file:
+            json.dump(self.summary(), file, indent=2, default=str)
+
+    def __enter__(self):
+        if not self.enabled:
+            return self
+        for name in self.OS_FUNCTIONS:
+            self._patch(os, name, f"os.{name}")
+        for name in self.OS_PATH_FUNCTIONS:
+            self._patch(os.path, name, f"os.path.{name}")
+        self._patch(FileCopier, "copy", "copy")
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.enabled:
+            return
+        self._seconds = time.perf_counter() - self._start
+        for owner, attribute, original in reversed(self._originals):
+            setattr(owner, attribute, original)
+        self._originals.clear()
@@ -1,5 +1,11 @@
-from app import run_app
+import sys
 
 
 if __name__ == "__main__":
-    run_app()
+    # Run headless when arguments are given, otherwise start the interactive prompts
+    if len(sys.argv) > 1:
+        from cli import main
+        sys.exit(main())
+    else:
+        from app import run_app
+        run_app()
@@ -1,6 +1,53 @@
 import os.path
+import re
+from functools import lru_cache
+from enums import CMSPathTypes
+from path_finder import PathFinder
 from constants import *
 
+FILE_NUMBER_PATTERN = re.compile(r"\b\d{6}")
+NUMBER_PATTERN = re.compile(r"\d+")
+
+
+@lru_cache(maxsize=None)
+def _product_range_path(parent_folder: str, block: str) -> str:
+    """
+    Build the range folder path shared by every file number starting with the same 4 digits.
+    """
+    return os.path.join(DRIVE_LETTER, CMS_FOLDER, parent_folder,
+                        block[:3] + "000" + "-" + block[:3] + "999",
+                        block[:3] + block[3] + "00" + "-" + block[:3] + block[3] + "99")
+
+
+@lru_cache(maxsize=None)
+def _site_range_path(code_prefix: str) -> str:
+    """
+    Build the range folder path shared by every company code starting with the same 3 digits in Site Submissions.
+    """
+    return os.path.join(DRIVE_LETTER, CMS_FOLDER, SITE_SUBMISSIONS, "0" + code_prefix[:2] + "000" + "-" + "0" +
+                        code_prefix[:2] + "999", "0" + code_prefix[:3] + "00" + "-" + "0" + code_prefix[:3] + "99")
+
+
+@lru_cache(maxsize=None)
+def _company_range_path(parent_folder: str, code_prefix: str) -> str:
+    """
+    Build the range folder path shared by every company code starting with the same 3 digits in a company folder.
+    """
+    return os.path.join(DRIVE_LETTER, CMS_FOLDER, parent_folder,
+                        code_prefix[0] + "0000" + "-" + code_prefix[0] + "9999",
+                        code_prefix[:2] + "000" + "-" + code_prefix[:2] + "999",
+                        code_prefix[:3] + "00" + "-" + code_prefix[:3] + "99")
+
+
+@lru_cache(maxsize=None)
+def _master_file_range_path(code_prefix: str) -> str:
+    """
+    Build the range folder path shared by every company code starting with the same 2 digits in Master Files.
+    """
+    folder_range = code_prefix[0] + "0000" + "-" + code_prefix[0] + "4999" if int(code_prefix[1]) <= 4 else \
+        code_prefix[0] + "5000" + "-" + code_prefix[0] + "9999"
+    return os.path.join(DRIVE_LETTER, CMS_FOLDER, MASTER_FILES, folder_range)
+
 
 class MapPathBuilder:
 
@@ -13,15 +60,9 @@ class MapPathBuilder:
         """
         # Check to see if the submission number is within specific ranges
         if 100000 <= int(file_number) <= 257999:
-            return os.path.join(DRIVE_LETTER, CMS_FOLDER, APPLICATION_WORKBOOKS,
-                                file_number[:3] + "000" + "-" + file_number[:3] + "999",
-                                file_number[:3] + file_number[3] + "00" + "-" + file_number[:3] +
-                                file_number[3] + "99")
+            return _product_range_path(APPLICATION_WORKBOOKS, file_number[:4])
         elif 400000 <= int(file_number) <= 807999:
-            return os.path.join(DRIVE_LETTER, CMS_FOLDER, SUBMISSIONS,
-                                file_number[:3] + "000" + "-" + file_number[:3] + "999",
-                                file_number[:3] + file_number[3] + "00" + "-" + file_number[:3] +
-                                file_number[3] + "99")
+            return _product_range_path(SUBMISSIONS, file_number[:4])
         else:
             return None
 
@@ -32,9 +73,7 @@ class MapPathBuilder:
 
         :return: The built path as a string or None if the submission number is not within the specified ranges.
         """
-        return os.path.join(DRIVE_LETTER, CMS_FOLDER, SITE_SUBMISSIONS, "0" + company_code[:2] + "000" + "-" + "0" +
-                            company_code[:2] + "999", "0" + company_code[:3] + "00" + "-" + "0" +
-                            company_code[:3] + "99", company_code, file_number)
+        return os.path.join(_site_range_path(company_code[:3]), company_code, file_number)
 
     def build_foreign_site_path(self, company_code, file_number) -> str or None:
         """
@@ -51,10 +90,7 @@ class MapPathBuilder:
 
         :return: The built path as a string or None if the submission number is not within the specified ranges.
         """
-        return os.path.join(DRIVE_LETTER, CMS_FOLDER, TRADING_PARTNER_FILES,
-                            company_code[0] + "0000" + "-" + company_code[0] + "9999",
-                            company_code[:2] + "000" + "-" + company_code[:2] + "999",
-                            company_code[:3] + "00" + "-" + company_code[:3] + "99", company_code)
+        return os.path.join(_company_range_path(TRADING_PARTNER_FILES, company_code[:3]), company_code)
 
     @staticmethod
     def build_clinical_trial_path() -> str or None:
@@ -73,10 +109,7 @@ class MapPathBuilder:
 
         :return: The built path as a string or None if the submission number is not within the specified ranges.
         """
-        return os.path.join(DRIVE_LETTER, CMS_FOLDER, COMPANY_UPDATES,
-                            company_code[0] + "0000" + "-" + company_code[0] + "9999",
-                            company_code[:2] + "000" + "-" + company_code[:2] + "999",
-                            company_code[:3] + "00" + "-" + company_code[:3] + "99", company_code)
+        return os.path.join(_company_range_path(COMPANY_UPDATES, company_code[:3]), company_code)
 
     @staticmethod
     def build_master_file_path(company_code) -> str or None:
@@ -85,6 +118,84 @@ class MapPathBuilder:
 
         :return: The built path as a string or None if the submission number is not within the specified ranges.
         """
-        folder_range = company_code[0] + "0000" + "-" + company_code[0] + "4999" if int(company_code[1]) <= 4 else \
-            company_code[0] + "5000" + "-" + company_code[0] + "9999"
-        return os.path.join(DRIVE_LETTER, CMS_FOLDER, MASTER_FILES, folder_range, company_code)
\ No newline at end of file
+        return os.path.join(_master_file_range_path(company_code[:2]), company_code)
+
+    def build_path(self, path_type: str, identifier, path_finder: PathFinder = None) -> str or None:
+        """
+        Build the CMS path of any path type from a Submission column value.
+
+        Product values hold a file number and optionally a submission number, Site and Foreign Site values a company
+        code followed by a file number, and the other types a company code.
+
+        :param path_type: The CMSPathTypes value of the path to build.
+        :param identifier: The Submission column value.
+        :param path_finder: (Optional) The path finder used to search the range folders for the Product types. A new one
+            is created if none is given.
+
+        :return: The built path, or None if the value doesn't hold the numbers the path type needs.
+
+        :raises FileNotFoundError: If the range folder of a Product path doesn't exist.
+        """
+        if path_type in CMSPathTypes.get_product_values():
+            matches = FILE_NUMBER_PATTERN.findall(str(identifier).lower())
+            if not matches:
+                return None
+            if path_finder is None:
+                path_finder = PathFinder()
+            range_path = self.build_product_path(matches[0])
+            if path_type == CMSPathTypes.PRODUCT_POST_LICENCE_FOLDER.value:
+                return path_finder.find_product_post_licence_folder(range_path, matches[0])
+            # File and submission number
+            if len(matches) == 2:
+                return path_finder.find_product_folder(range_path, matches[0], matches[1])
+            # File number only
+            elif len(matches) == 1:
+                return path_finder.find_product_folder(range_path, matches[0])
+            return None
+
+        if path_type == CMSPathTypes.CLINICAL_TRIAL.value:
+            return self.build_clinical_trial_path()
+
+        numbers = NUMBER_PATTERN.findall(str(identifier))
+        if path_type in (CMSPathTypes.SITE.value, CMSPathTypes.FOREIGN_SITE.value):
+            if len(numbers) < 2 or len(numbers[0]) < 3:
+                return None
+            if path_type == CMSPathTypes.SITE.value:
+                return self.build_site_path(numbers[0], numbers[1])
+            return self.build_foreign_site_path(numbers[0], numbers[1])
+
+        if not numbers or len(numbers[0]) < 3:
+            return None
+        if path_type == CMSPathTypes.TRADING_PARTNER.value:
+            return self.build_trading_partner_path(numbers[0])
+        elif path_type == CMSPathTypes.COMPANY.value:
+            return self.build_company_path(numbers[0])
+        elif path_type == CMSPathTypes.MASTER_FILE.value:
+            return self.build_master_file_path(numbers[0])
+        return None
+
+    def build_paths(self, path_type: str, identifiers: list, path_finder: PathFinder = None) -> list:
+        """
+        Build the CMS paths of a whole Submission column in one call.
+
+        The range folders are memoized, so rows with the same company code or file number block only build them once,
+        and the Product types share the path finder's directory cache between rows.
+
+        :param path_type: The CMSPathTypes value of the paths to build.
+        :param identifiers: The Submission column values.
+        :param path_finder: (Optional) The path finder used to search the range folders for the Product types. A new one
+            is created if none is given.
+
+        :return: The built paths in the same order as the identifiers. Values that don't hold the numbers the path type
+            needs are None, and Product values whose range folder doesn't exist are an empty string.
+        """
+        if path_finder is None and path_type in CMSPathTypes.get_product_values():
+            path_finder = PathFinder()
+
+        paths = []
+        for identifier in identifiers:
+            try:
+                paths.append(self.build_path(path_type, identifier, path_finder))
+            except FileNotFoundError:
+                paths.append("")
+        return paths
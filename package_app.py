@@ -1,26 +1,56 @@
+import argparse
 import subprocess
 import shutil
 import os
 
+APP_NAME = "CMS Automation Tool"
+
+
+def build(mode: str):
+    """
+    Build the executable with PyInstaller and check that it starts.
+
+    :param mode: "onefile" builds a single exe, which unpacks itself to a temp folder on every launch. "onedir" builds a
+        folder with the exe next to its libraries, which starts much faster from a network drive.
+    """
+    subprocess.run([
+        "pyinstaller",
+        f"--{mode}",
+        "--name", "main",
+        "--add-data", r"enums.py;.",
+        "--add-data", r"constants.py;.",
+        "--add-data", r"map_path_builder.py;.",
+        "--add-data", r"path_finder.py;.",
+        "--hidden-import=openpyxl",
+        "--hidden-import=rich",
+        "--hidden-import=logging",
+        "main.py"
+    ], text=True, check=True)
+
+    shutil.rmtree("build")
+    os.remove("main.spec")
+    if mode == "onefile":
+        os.rename("dist/main.exe", f"{APP_NAME}.exe")
+        executable_path = f"{APP_NAME}.exe"
+    else:
+        if os.path.isdir(APP_NAME):
+            shutil.rmtree(APP_NAME)
+        os.rename("dist/main", APP_NAME)
+        os.rename(os.path.join(APP_NAME, "main.exe"), os.path.join(APP_NAME, f"{APP_NAME}.exe"))
+        executable_path = os.path.join(APP_NAME, f"{APP_NAME}.exe")
+    shutil.rmtree("dist")
+
+    # Make sure the bundle has everything the tools load lazily before handing it out
+    subprocess.run([executable_path, "self-check"], text=True, check=True)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Package the {APP_NAME} with PyInstaller.")
+    parser.add_argument("--mode", choices=["onefile", "onedir"], default="onefile",
+                        help="onefile builds a single exe, onedir builds a faster starting folder.")
+    args = parser.parse_args()
     try:
-        process = subprocess.run([
-            "pyinstaller",
-            "--onefile",
-            "--add-data", r"enums.py;.",
-            "--add-data", r"constants.py;.",
-            "--add-data", r"map_path_builder.py;.",
-            "--add-data", r"path_finder.py;.",
-            "--hidden-import=openpyxl",
-            "--hidden-import=rich",
-            "--hidden-import=logging",
-            "main.py"
-        ], text=True, check=True)
-
-        shutil.rmtree("build")
-        os.remove("main.spec")
-        os.rename("dist/main.exe", f"CMS Automation Tool.exe")
-        shutil.rmtree("dist")
+        build(args.mode)
 
     except Exception as e:
-        print("Error:", e)
\ No newline at end of file
+        print("Error:", e)
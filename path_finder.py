@@ -1,12 +1,55 @@
 import os
+from collections import deque
 from enums import CMSFolders
 from constants import *
+from directory_cache import DirectoryCache
 
 
 class PathFinder:
 
-    @staticmethod
-    def find_product_folder(range_path: str, file_number: str, submission_number: str = None):
+    def __init__(self, directory_cache: DirectoryCache = None, max_search_depth: int = SUBMISSION_SEARCH_MAX_DEPTH,
+                 pruned_folders: list = None):
+        """
+        :param directory_cache: (Optional) The directory listing cache to share between lookups. A new one is created
+            if none is given.
+        :param max_search_depth: How many levels below a product folder to search for a submission folder.
+        :param pruned_folders: (Optional) The names of folders whose contents aren't searched for submission folders.
+            Default is the CMSFolders content folders.
+        """
+        self.directory_cache = directory_cache if directory_cache is not None else DirectoryCache()
+        self.max_search_depth = max_search_depth
+        self.pruned_folders = {folder.lower() for folder in
+                               (pruned_folders if pruned_folders is not None else CMSFolders.get_values())}
+
+    def _search_sub_folders(self, top: str, name_part: str) -> str or None:
+        """
+        Search the folders under a folder breadth-first for one whose name contains the given text.
+
+        The search stops at the first match, doesn't go deeper than the maximum search depth and doesn't look inside
+        the pruned content folders. Folders that can't be listed are skipped.
+
+        :param top: The path of the folder to search.
+        :param name_part: The text to look for in the folder names.
+
+        :return: The path of the first matching folder, or None if there isn't one.
+        """
+        name_part = name_part.lower()
+        queue = deque([(top, 1)])
+        while queue:
+            path, depth = queue.popleft()
+            try:
+                sub_folders = self.directory_cache.list_sub_folders(path)
+            except OSError:
+                continue
+            for sub_folder in sub_folders:
+                if name_part in sub_folder.lower():
+                    return os.path.join(path, sub_folder)
+            if depth < self.max_search_depth:
+                queue.extend((os.path.join(path, sub_folder), depth + 1) for sub_folder in sub_folders
+                             if sub_folder.lower() not in self.pruned_folders)
+        return None
+
+    def find_product_folder(self, range_path: str, file_number: str, submission_number: str = None):
         """
         Finds the product folder based on the given parameters.
 
@@ -16,42 +59,35 @@ class PathFinder:
 
         :return: The path of the found folder or None if not found.
         """
-        # Get a filtered list of relevant folders
-        folders = [folder for folder in os.listdir(range_path) if
-                   file_number.lower() in folder and os.path.isdir(os.path.join(range_path, folder))]
+        # Get the relevant folders from the index of the range folder
+        folders = self.directory_cache.name_index(range_path).folders(file_number)
         # Submission number passed as an argument
         if submission_number is not None:
             # Iterate the folders
-            for folder in folders:
+            for folder, _, _ in folders:
                 # Submission number is in the folder name
                 if submission_number.lower() in folder.lower():
                     return os.path.join(range_path, folder)
-                # Submission number not in the parent folder name - Walk through the directories to find it
-                for root, dirs, files in os.walk(os.path.join(range_path, folder)):
-                    for item in dirs:
-                        # Submission number is in the sub folder name
-                        if submission_number.lower() in item.lower():
-                            return os.path.join(root, item)
+                # Submission number not in the parent folder name - Search the sub folders for it
+                path = self._search_sub_folders(os.path.join(range_path, folder), submission_number)
+                if path is not None:
+                    return path
             # Folder doesn't exist for file number - submission number - create one based on pattern
             return os.path.join(range_path, file_number, f"{file_number} - {submission_number}")
 
         else:
-            for folder in folders:
-                # Find matching file number
-                if file_number.lower() in folder.lower() and f"{file_number}." not in folder.lower() and f"{file_number} -" not in folder.lower() and f"{file_number}-" not in folder.lower():
-                    # Get a list of sub folders
-                    sub_folders = [sub_folder for sub_folder in os.listdir(os.path.join(range_path, folder)) if
-                                   os.path.isdir(os.path.join(range_path, folder, sub_folder))]
+            for folder, qualified, _ in folders:
+                # Find matching file number - Not followed by a ".", " -" or "-"
+                if not qualified:
+                    sub_folder_index = self.directory_cache.name_index(os.path.join(range_path, folder))
                     # Check for CMS folders - If they exist you can use the current folder as the path
-                    for subFolder in sub_folders:
-                        for item in CMSFolders:
-                            if item.value in subFolder:
-                                return os.path.join(range_path, folder)
+                    if sub_folder_index.has_cms_folder:
+                        return os.path.join(range_path, folder)
                     # CMS Folders don't exist at this level
                     # Search for sub folder with file number in it
-                    for subFolder in sub_folders:
-                        if file_number.lower() in subFolder.lower() and f"{file_number}." not in subFolder.lower() and f"{file_number} -" not in subFolder.lower() and f"{file_number}-" not in subFolder.lower() and "discussion" not in subFolder.lower():
-                            return os.path.join(range_path, folder, subFolder)
+                    for sub_folder, sub_folder_qualified, discussion in sub_folder_index.folders(file_number):
+                        if not sub_folder_qualified and not discussion:
+                            return os.path.join(range_path, folder, sub_folder)
                     # File number doesn't exist in sub folders - Create it
                     return os.path.join(range_path, folder, file_number)
             # Folder doesn't exist for file number - create one based on pattern
@@ -67,8 +103,8 @@ class PathFinder:
         :return: The path to the Post Licence folder.
         """
         file_path = self.find_product_folder(range_path, file_number)
-        if os.path.isdir(file_path):
-            for folder in os.listdir(file_path):
+        if self.directory_cache.is_dir(file_path):
+            for folder, _ in self.directory_cache.list_dir(file_path):
                 if POST_LICENCE_FOLDER_NAME.lower() in folder.lower():
                     return os.path.join(file_path, folder)
         # Post Licence folder not found - Create path based on pattern
@@ -0,0 +1,193 @@
+import json
+import logging
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+
+class _RowRecordFilter(logging.Filter):
+    """
+    Passes either only the structured row records or only the plain message records.
+    """
+
+    def __init__(self, structured: bool):
+        super().__init__()
+        self.structured = structured
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return hasattr(record, "row_record") == self.structured
+
+
+class _JsonLinesFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(dict(record.row_record, time=record.created), default=str)
+
+
+class RunLogger:
+    """
+    Logs the rows of a bulk run without holding up the rows.
+
+    Messages are put on a queue and written to the log files by a background listener, and the console shows one
+    progress display that a background thread redraws a few times a second instead of printing every row. Recording a
+    row only appends to the queue and updates counters. Nothing is configured on the root logger.
+    """
+
+    def __init__(self, name: str, log_file_path: str = None, structured_log_file_path: str = None,
+                 show_progress: bool = True, refresh_seconds: float = 0.25):
+        """
+        :param name: The name of the run's logger, such as "bulk_uploader".
+        :param log_file_path: (Optional) The text log file to write the row messages to. It is overwritten.
+        :param structured_log_file_path: (Optional) The JSONL file to write one record per row to, with the row number,
+            source, destination, outcome, bytes copied and duration. It is overwritten.
+        :param show_progress: A boolean indicating whether to show the progress display on the console.
+        :param refresh_seconds: How often the progress display is redrawn.
+        """
+        self.log_file_path = log_file_path
+        self.structured_log_file_path = structured_log_file_path
+        self.show_progress = show_progress
+        self.refresh_seconds = refresh_seconds
+        self.counts = {}
+        self.completed = 0
+        self._logger = logging.getLogger(f"cms_automation.{name}")
+        self._queue_handler = None
+        self._listener = None
+        self._file_handlers = []
+        self._progress = None
+        self._task = None
+        self._description = ""
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._refresher = None
+
+    @property
+    def started(self) -> bool:
+        return self._listener is not None or self._progress is not None
+
+    def start(self, total: int = None, description: str = "Working", progress: bool = True):
+        """
+        Open the log files and show the progress display.
+
+        :param total: (Optional) The number of rows in the run, if it is known.
+        :param description: The text shown in front of the progress bar.
+        :param progress: A boolean indicating whether the run has rows to show progress for. A dry run only logs
+            messages, so it doesn't show the display even if the logger was created to show it.
+        """
+        if self.log_file_path is not None:
+            handler = logging.FileHandler(self.log_file_path, mode="w", encoding="utf-8")
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            handler.addFilter(_RowRecordFilter(structured=False))
+            self._file_handlers.append(handler)
+        if self.structured_log_file_path is not None:
+            handler = logging.FileHandler(self.structured_log_file_path, mode="w", encoding="utf-8")
+            handler.setFormatter(_JsonLinesFormatter())
+            handler.addFilter(_RowRecordFilter(structured=True))
+            self._file_handlers.append(handler)
+
+        if self._file_handlers:
+            log_queue = queue.SimpleQueue()
+            self._queue_handler = QueueHandler(log_queue)
+            self._logger.addHandler(self._queue_handler)
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            self._listener = QueueListener(log_queue, *self._file_handlers, respect_handler_level=True)
+            self._listener.start()
+
+        if self.show_progress and progress:
+            from rich.progress import Progress, BarColumn, MofNCompleteColumn, TextColumn, TimeElapsedColumn
+            self._description = description
+            self._progress = Progress(TextColumn("{task.description}"), BarColumn(), MofNCompleteColumn(),
+                                      TimeElapsedColumn(), auto_refresh=False)
+            self._task = self._progress.add_task(description, total=total)
+            self._progress.start()
+            self._refresher = threading.Thread(target=self._refresh_progress, daemon=True)
+            self._refresher.start()
+
+    def _refresh_progress(self):
+        while not self._stopped.wait(self.refresh_seconds):
+            self._update_progress()
+
+    def _update_progress(self):
+        with self._lock:
+            completed = self.completed
+            counts = ", ".join(f"{outcome} {count}" for outcome, count in sorted(self.counts.items()))
+        self._progress.update(self._task, completed=completed,
+                              description=f"{self._description} ({counts})" if counts else self._description)
+        self._progress.refresh()
+
+    def info(self, message: str):
+        """
+        Write a message to the text log.
+        """
+        if self._queue_handler is not None:
+            self._logger.info(message)
+
+    def error(self, message: str):
+        """
+        Write an error to the text log.
+        """
+        if self._queue_handler is not None:
+            self._logger.error(message)
+
+    def row(self, row_number: int, row, outcome: str, messages: list, error: str = None, copy_result=None,
+            seconds: float = None):
+        """
+        Record the outcome of a row.
+
+        :param row_number: The row number in the Excel file.
+        :param row: The row's Submission, Source and Destination values.
+        :param outcome: The CMSUploadOutcomes value of the row.
+        :param messages: The messages describing what was done for the row.
+        :param error: (Optional) The error the row failed with.
+        :param copy_result: (Optional) The CopyResult of the file copied for the row.
+        :param seconds: (Optional) How long the row took.
+        """
+        with self._lock:
+            self.completed += 1
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+        if self._queue_handler is None:
+            return
+
+        for message in messages:
+            self._logger.info(message)
+        # Log the error
+        if error is not None:
+            self._logger.error(error)
+        if self.structured_log_file_path is not None:
+            self._logger.info(outcome, extra={"row_record": {
+                "row": row_number,
+                "submission": row[0],
+                "source": row[1],
+                "destination": row[2],
+                "outcome": outcome,
+                "error": error,
+                "bytes": copy_result.bytes_copied if copy_result is not None else 0,
+                "seconds": seconds,
+            }})
+
+    def close(self):
+        """
+        Draw the final progress, then flush and close the log files.
+        """
+        if self._progress is not None:
+            self._stopped.set()
+            self._refresher.join()
+            self._update_progress()
+            self._progress.stop()
+            self._progress = None
+        if self._listener is not None:
+            self._listener.stop()
+            self._logger.removeHandler(self._queue_handler)
+            for handler in self._file_handlers:
+                handler.close()
+            self._listener = None
+            self._queue_handler = None
+            self._file_handlers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,123 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+_END = object()
+
+
+class StagedPipeline:
+    """
+    Runs rows through read, resolve and copy stages that overlap, connected by bounded asyncio queues.
+
+    Rows are read from the workbook in small chunks, destinations are resolved on one thread pool and files are copied
+    on another, so the first copy starts as soon as the first destination is known. The bounded queues stop a fast
+    stage from running far ahead of a slow one. Results are reported in row order, and the number of rows read but not
+    reported yet is capped, so one slow row holds back the reading instead of buffering the rest of the sheet.
+    """
+
+    def __init__(self, resolve_row, upload_row, resolve_workers: int = 4, copy_workers: int = 4,
+                 queue_size: int = 100, read_chunk_size: int = 50):
+        """
+        :param resolve_row: A function that takes a (row number, row) tuple and returns a tuple of the row with its
+            destination and None, or of the row and a result to report without copying it.
+        :param upload_row: A function that takes a (row number, row) tuple and returns its result tuple.
+        :param resolve_workers: The number of rows to resolve at the same time.
+        :param copy_workers: The number of rows to copy at the same time.
+        :param queue_size: The maximum number of rows waiting between two stages.
+        :param read_chunk_size: The number of rows to read from the workbook at a time.
+        """
+        self.resolve_row = resolve_row
+        self.upload_row = upload_row
+        self.resolve_workers = max(1, resolve_workers)
+        self.copy_workers = max(1, copy_workers)
+        self.queue_size = max(1, queue_size)
+        self.read_chunk_size = max(1, read_chunk_size)
+
+    def run(self, rows, on_result):
+        """
+        Run the pipeline until every row has been reported.
+
+        :param rows: An iterable of (row number, row) tuples. It is read on a worker thread, so it can be a streaming
+            workbook reader.
+        :param on_result: A function called with (row number, row, result) for each row, in row order.
+
+        :raises Exception: The first error raised by a stage or by on_result. The other stages are stopped.
+        """
+        asyncio.run(self._run(rows, on_result))
+
+    async def _run(self, rows, on_result):
+        loop = asyncio.get_running_loop()
+        resolve_queue = asyncio.Queue(self.queue_size)
+        copy_queue = asyncio.Queue(self.queue_size)
+        pending = {}
+        next_index = 0
+        resolvers_left = self.resolve_workers
+        # Rows read but not reported yet - Bounded so a stuck row can't make the reorder buffer hold the whole sheet
+        in_flight = asyncio.Semaphore(2 * self.queue_size + self.resolve_workers + self.copy_workers)
+
+        def report(index, numbered_row, result):
+            nonlocal next_index
+            pending[index] = (numbered_row, result)
+            # Hold results back until every earlier row has been reported
+            while next_index in pending:
+                (row_number, row), row_result = pending.pop(next_index)
+                on_result(row_number, row, row_result)
+                next_index += 1
+                in_flight.release()
+
+        def read_chunk(iterator):
+            chunk = []
+            for numbered_row in iterator:
+                chunk.append(numbered_row)
+                if len(chunk) == self.read_chunk_size:
+                    break
+            return chunk
+
+        async def read(reader_executor):
+            iterator = iter(rows)
+            index = 0
+            while True:
+                chunk = await loop.run_in_executor(reader_executor, read_chunk, iterator)
+                if not chunk:
+                    break
+                for numbered_row in chunk:
+                    await in_flight.acquire()
+                    await resolve_queue.put((index, numbered_row))
+                    index += 1
+            for _ in range(self.resolve_workers):
+                await resolve_queue.put(_END)
+
+        async def resolve(resolve_executor):
+            nonlocal resolvers_left
+            while (item := await resolve_queue.get()) is not _END:
+                index, numbered_row = item
+                row, result = await loop.run_in_executor(resolve_executor, self.resolve_row, numbered_row)
+                # Rows that can't be resolved are reported without reaching the copy stage
+                if result is not None:
+                    report(index, (numbered_row[0], row), result)
+                else:
+                    await copy_queue.put((index, (numbered_row[0], row)))
+            # The last resolver to finish tells the copiers there are no more rows
+            resolvers_left -= 1
+            if resolvers_left == 0:
+                for _ in range(self.copy_workers):
+                    await copy_queue.put(_END)
+
+        async def copy(copy_executor):
+            while (item := await copy_queue.get()) is not _END:
+                index, numbered_row = item
+                report(index, numbered_row, await loop.run_in_executor(copy_executor, self.upload_row, numbered_row))
+
+        with ThreadPoolExecutor(max_workers=1) as reader_executor, \
+                ThreadPoolExecutor(max_workers=self.resolve_workers) as resolve_executor, \
+                ThreadPoolExecutor(max_workers=self.copy_workers) as copy_executor:
+            tasks = [asyncio.create_task(read(reader_executor))] + \
+                [asyncio.create_task(resolve(resolve_executor)) for _ in range(self.resolve_workers)] + \
+                [asyncio.create_task(copy(copy_executor)) for _ in range(self.copy_workers)]
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            failed = [task for task in done if task.exception() is not None]
+            # A failed stage would leave the others waiting on its queue forever - Stop them all and raise its error
+            if failed:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise failed[0].exception()
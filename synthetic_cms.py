@@ -0,0 +1,193 @@
+import builtins
+import os
+import random
+import threading
+import time
+import openpyxl
+from enums import CMSFolders, CMSSubmissionsFileExcelColumns
+from constants import APPLICATION_WORKBOOKS, SUBMISSIONS, POST_LICENCE_FOLDER_NAME
+
+
+def _range_path(cms_path: str, file_number: str) -> str:
+    parent = APPLICATION_WORKBOOKS if int(file_number) <= 257999 else SUBMISSIONS
+    return os.path.join(cms_path, parent,
+                        file_number[:3] + "000" + "-" + file_number[:3] + "999",
+                        file_number[:4] + "00" + "-" + file_number[:4] + "99")
+
+
+def generate_cms_tree(cms_path: str, products: int, submissions_per_product: int = 3, files_per_submission: int = 0,
+                      seed: int = 0) -> list:
+    """
+    Build a realistic local CMS tree for benchmarking.
+
+    Product folders are spread over the Application Workbooks and Submissions range folders. Some have the CMSFolders
+    a) to j) sub folders directly, some nest them in a file number folder, some only hold submission folders and some
+    have a Post Licence folder.
+
+    :param cms_path: The path of the CMS folder to create the tree in.
+    :param products: The number of product folders to create.
+    :param submissions_per_product: The number of submission folders to create in each product folder.
+    :param files_per_submission: The number of small files to create in each submission folder.
+    :param seed: The seed for the random layout, so the same tree can be built again.
+
+    :return: A list of (file number, submission numbers) tuples for the created products.
+    """
+    rng = random.Random(seed)
+    file_numbers = rng.sample(list(range(100000, 258000)) + list(range(400000, 808000)), products)
+    created = []
+
+    for file_number in sorted(str(number) for number in file_numbers):
+        range_path = _range_path(cms_path, file_number)
+        layout = rng.randrange(4)
+        # CMS folders directly in the product folder
+        if layout == 0:
+            product_path = os.path.join(range_path, f"{file_number} Product {rng.randrange(1000)}")
+            for folder in CMSFolders.get_values():
+                os.makedirs(os.path.join(product_path, folder), exist_ok=True)
+        # CMS folders nested in a file number folder
+        elif layout == 1:
+            product_path = os.path.join(range_path, f"{file_number} Product {rng.randrange(1000)}", file_number)
+            for folder in CMSFolders.get_values():
+                os.makedirs(os.path.join(product_path, folder), exist_ok=True)
+        # Submission folders only
+        elif layout == 2:
+            product_path = os.path.join(range_path, file_number)
+            os.makedirs(product_path, exist_ok=True)
+        # Post Licence folder
+        else:
+            product_path = os.path.join(range_path, f"{file_number} Product {rng.randrange(1000)}")
+            os.makedirs(os.path.join(product_path, f"i) {POST_LICENCE_FOLDER_NAME}"), exist_ok=True)
+
+        submission_numbers = []
+        for _ in range(submissions_per_product):
+            submission_number = str(rng.randrange(100000, 1000000))
+            submission_numbers.append(submission_number)
+            submission_path = os.path.join(product_path, f"{file_number} - {submission_number}")
+            os.makedirs(submission_path, exist_ok=True)
+            for index in range(files_per_submission):
+                with open(os.path.join(submission_path, f"document {index}.pdf"), "wb") as file:
+                    file.write(b"%PDF-1.4\n" + rng.randbytes(1024))
+        created.append((file_number, submission_numbers))
+
+    return created
+
+
+def generate_path_builder_workbook(file_path: str, products: list, rows: int, seed: int = 0):
+    """
+    Write a Path Builder submissions file for a generated CMS tree.
+
+    :param file_path: The path of the Excel file to write.
+    :param products: The products returned by generate_cms_tree.
+    :param rows: The number of rows to write.
+    :param seed: The seed for picking rows, so the same file can be built again.
+    """
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append([CMSSubmissionsFileExcelColumns.SUBMISSION.value, CMSSubmissionsFileExcelColumns.SOURCE.value])
+    for _ in range(rows):
+        file_number, submission_numbers = rng.choice(products)
+        # Mix of file and submission number rows, file number only rows and submissions that don't exist yet
+        choice = rng.randrange(3)
+        if choice == 0:
+            submission = f"{file_number}-{rng.choice(submission_numbers)}"
+        elif choice == 1:
+            submission = file_number
+        else:
+            submission = f"{file_number}-{rng.randrange(100000, 1000000)}"
+        ws.append([submission, ""])
+    wb.save(file_path)
+
+
+def generate_bulk_uploader_workbook(file_path: str, source_path: str, destination_path: str, rows: int,
+                                    file_size: int = 64 * 1024, destinations: int = 20, seed: int = 0):
+    """
+    Write a Bulk Uploader submissions file with generated source files.
+
+    :param file_path: The path of the Excel file to write.
+    :param source_path: The folder to create the source files in.
+    :param destination_path: The folder the destination folders are created under.
+    :param rows: The number of rows and source files to write.
+    :param file_size: The size of each source file in bytes.
+    :param destinations: The number of distinct destination folders to spread the rows over.
+    :param seed: The seed for the file contents, so the same files can be built again.
+    """
+    rng = random.Random(seed)
+    os.makedirs(source_path, exist_ok=True)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append([CMSSubmissionsFileExcelColumns.SUBMISSION.value, CMSSubmissionsFileExcelColumns.SOURCE.value,
+               CMSSubmissionsFileExcelColumns.DESTINATION.value])
+    for index in range(rows):
+        source = os.path.join(source_path, f"document {index}.pdf")
+        with open(source, "wb") as file:
+            file.write(rng.randbytes(file_size))
+        ws.append([str(index), source, os.path.join(destination_path, f"destination {index % destinations}")])
+    wb.save(file_path)
+
+
+class FilesystemLatencyShim:
+    """
+    Adds artificial latency to file system calls under a root path and counts them, to mimic an SMB share locally.
+
+    Use it as a context manager. It patches the os functions that the os.path helpers, os.walk, os.makedirs and
+    shutil are built on, so the whole process sees the latency while it is active.
+    """
+
+    PATCHED_FUNCTIONS = ["stat", "lstat", "scandir", "listdir", "mkdir", "replace", "remove", "utime", "chmod"]
+
+    def __init__(self, root: str, latency_seconds: float = 0.0):
+        """
+        :param root: Only calls on paths under this folder are delayed and counted.
+        :param latency_seconds: The latency to add to each call.
+        """
+        self.root = os.path.normcase(os.path.abspath(root))
+        self.latency_seconds = latency_seconds
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._originals = {}
+
+    def _is_under_root(self, path) -> bool:
+        if isinstance(path, int) or path is None:
+            return False
+        return os.path.normcase(os.path.abspath(os.fsdecode(path))).startswith(self.root)
+
+    def _wrap(self, name: str, function):
+        def wrapper(path=None, *args, **kwargs):
+            if self._is_under_root(path):
+                with self._lock:
+                    self.counts[name] = self.counts.get(name, 0) + 1
+                if self.latency_seconds:
+                    time.sleep(self.latency_seconds)
+            if path is None:
+                return function(*args, **kwargs)
+            return function(path, *args, **kwargs)
+        return wrapper
+
+    @property
+    def total_calls(self) -> int:
+        """
+        The number of metadata calls made under the root, not counting file opens.
+        """
+        return sum(count for name, count in self.counts.items() if name != "open")
+
+    def reset(self):
+        """
+        Reset the call counters.
+        """
+        with self._lock:
+            self.counts.clear()
+
+    def __enter__(self):
+        for name in self.PATCHED_FUNCTIONS:
+            self._originals[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self._originals[name]))
+        self._originals["open"] = builtins.open
+        builtins.open = self._wrap("open", builtins.open)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        builtins.open = self._originals.pop("open")
+        for name, function in self._originals.items():
+            setattr(os, name, function)
+        self._originals.clear()
@@ -0,0 +1,220 @@
+import errno
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from file_copier import CopyVerificationError
+
+TRANSIENT_ERRNOS = {getattr(errno, name) for name in
+                    ["ETIMEDOUT", "ECONNRESET", "ECONNABORTED", "ECONNREFUSED", "EHOSTUNREACH", "ENETUNREACH",
+                     "ENETDOWN", "ENETRESET", "EAGAIN", "EBUSY", "EIO", "ESTALE"] if hasattr(errno, name)}
+# Windows network and sharing errors: sharing and lock violations, network path not found, unexpected network error,
+# network name no longer available, network name not found, semaphore timeout and the connection errors
+TRANSIENT_WINERRORS = {32, 33, 53, 59, 64, 67, 121, 1231, 1232, 1236}
+
+
+class ShareUnavailableError(OSError):
+    """
+    Raised when the CMS share doesn't come back within the pause timeout.
+    """
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Check if an error is likely to go away if the operation is tried again.
+
+    :param error: The error raised by the operation.
+
+    :return: True for network, timeout, sharing and verification errors, False for errors such as a missing source
+        file or a denied permission that fail the same way every time.
+    """
+    if isinstance(error, ShareUnavailableError):
+        return False
+    if isinstance(error, (CopyVerificationError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, OSError):
+        return getattr(error, "winerror", None) in TRANSIENT_WINERRORS or error.errno in TRANSIENT_ERRNOS
+    return False
+
+
+class TransferController:
+    """
+    Retries transient transfer errors and adapts the number of copies in flight to how the share is coping.
+
+    Operations run through run, which holds an in-flight slot while the operation runs. After every window of
+    operations the limit is halved if too many failed or the median latency rose well above the best seen so far, and
+    raised by one otherwise. Transient errors are retried with jittered exponential backoff. When an operation fails and
+    the share is gone, every operation waits until it is back instead of failing.
+    """
+
+    def __init__(self, check_paths: list, max_in_flight: int, min_in_flight: int = 1, max_attempts: int = 5,
+                 base_delay_seconds: float = 0.5, max_delay_seconds: float = 30.0, window_size: int = 20,
+                 max_error_rate: float = 0.1, latency_factor: float = 2.0, pause_timeout_seconds: float = 1800.0,
+                 poll_seconds: float = 10.0):
+        """
+        :param check_paths: The paths that must exist for the share to be considered available, such as the VPN check
+            path and the CMS folder.
+        :param max_in_flight: The most operations to run at the same time.
+        :param min_in_flight: The fewest operations to run at the same time.
+        :param max_attempts: The number of times to try an operation that keeps failing with transient errors.
+        :param base_delay_seconds: The backoff before the first retry. It doubles for each later retry.
+        :param max_delay_seconds: The longest backoff before a retry.
+        :param window_size: The number of operations to observe before adjusting the limit.
+        :param max_error_rate: The share of failed operations in a window above which the limit is lowered.
+        :param latency_factor: How many times the best median latency the window's median latency can reach before
+            the limit is lowered.
+        :param pause_timeout_seconds: How long to wait for the share to come back before failing the operation.
+        :param poll_seconds: How often to check if the share is back while paused.
+        """
+        self.check_paths = check_paths
+        self.max_in_flight = max(1, max_in_flight)
+        self.min_in_flight = max(1, min(min_in_flight, self.max_in_flight))
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.window_size = window_size
+        self.max_error_rate = max_error_rate
+        self.latency_factor = latency_factor
+        self.pause_timeout_seconds = pause_timeout_seconds
+        self.poll_seconds = poll_seconds
+        self.limit = max(self.min_in_flight, self.max_in_flight // 2)
+        self.retries = 0
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        self._in_flight = 0
+        self._window = []
+        self._best_latency = None
+        self._share_lost = False
+        self._condition = threading.Condition()
+        self._share_available = threading.Event()
+        self._share_available.set()
+        self._pause_lock = threading.Lock()
+
+    @contextmanager
+    def _slot(self):
+        with self._condition:
+            while self._in_flight >= self.limit:
+                self._condition.wait()
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _record(self, seconds: float, failed: bool):
+        with self._condition:
+            self._window.append((seconds, failed))
+            if len(self._window) < self.window_size:
+                return
+            error_rate = sum(1 for _, window_failed in self._window if window_failed) / len(self._window)
+            latencies = sorted(window_seconds for window_seconds, window_failed in self._window if not window_failed)
+            latency = latencies[len(latencies) // 2] if latencies else None
+            if latency is not None and (self._best_latency is None or latency < self._best_latency):
+                self._best_latency = latency
+            self._window.clear()
+
+            # Back off quickly when the share struggles and probe for more slowly when it copes
+            if error_rate > self.max_error_rate or \
+                    (latency is not None and latency > self._best_latency * self.latency_factor):
+                self.limit = max(self.min_in_flight, self.limit // 2)
+            elif self.limit < self.max_in_flight:
+                self.limit += 1
+            self._condition.notify_all()
+
+    def share_available(self) -> bool:
+        """
+        Check if every check path exists.
+        """
+        return all(os.path.exists(path) for path in self.check_paths)
+
+    def _wait_for_share(self):
+        """
+        Pause until the share is back, with one thread checking for it while the others wait.
+
+        :raises ShareUnavailableError: If the share doesn't come back within the pause timeout.
+        """
+        with self._pause_lock:
+            if self._share_lost:
+                raise ShareUnavailableError("The CMS share is unavailable")
+            if self.share_available():
+                return
+            self._share_available.clear()
+            self.pauses += 1
+            start = time.monotonic()
+            try:
+                while not self.share_available():
+                    if time.monotonic() - start > self.pause_timeout_seconds:
+                        # Fail the remaining operations straight away rather than waiting again for each one
+                        self._share_lost = True
+                        raise ShareUnavailableError(f"The CMS share didn't come back within "
+                                                    f"{self.pause_timeout_seconds:.0f}s")
+                    time.sleep(self.poll_seconds)
+            finally:
+                self.paused_seconds += time.monotonic() - start
+                self._share_available.set()
+
+    def backoff_seconds(self, attempt: int) -> float:
+        """
+        Get the jittered delay before a retry.
+
+        :param attempt: The number of the attempt that failed, starting at 1.
+
+        :return: A random delay between half and all of the exponential backoff for the attempt.
+        """
+        delay = min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (attempt - 1))
+        return random.uniform(delay / 2, delay)
+
+    def run(self, operation, on_retry=None):
+        """
+        Run an operation, retrying it while it fails with transient errors.
+
+        :param operation: A function that takes no arguments. It must be safe to run again after it failed part way.
+        :param on_retry: (Optional) A function called with the error, the failed attempt number and the backoff in
+            seconds before each retry.
+
+        :return: The result of the operation.
+
+        :raises Exception: The last error if the operation failed with a permanent error or ran out of attempts.
+        """
+        attempt = 0
+        while True:
+            self._share_available.wait()
+            if self._share_lost:
+                raise ShareUnavailableError("The CMS share is unavailable")
+            attempt += 1
+            try:
+                with self._slot():
+                    # Only time the operation itself, not the wait for a slot
+                    start = time.perf_counter()
+                    try:
+                        result = operation()
+                    finally:
+                        seconds = time.perf_counter() - start
+            except Exception as e:
+                self._record(seconds, True)
+                # A lost share can look like any error - Wait for it to come back and try again without using up
+                # an attempt
+                if not self.share_available():
+                    self._wait_for_share()
+                    attempt -= 1
+                    continue
+                if not is_transient(e) or attempt >= self.max_attempts:
+                    raise
+                delay = self.backoff_seconds(attempt)
+                self.retries += 1
+                if on_retry is not None:
+                    on_retry(e, attempt, delay)
+                time.sleep(delay)
+                continue
+            self._record(seconds, False)
+            return result
+
+    def summary(self) -> str:
+        """
+        Describe what the controller did during the run.
+        """
+        return f"Transfer controller: {self.retries} retries, {self.pauses} pauses ({self.paused_seconds:.1f}s), " \
+               f"finished with {self.limit} of {self.max_in_flight} copies in flight"
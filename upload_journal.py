@@ -0,0 +1,100 @@
+import json
+import os
+import time
+from enums import CMSUploadOutcomes
+
+
+class UploadJournal:
+    """
+    Append-only JSONL journal of bulk upload row outcomes.
+
+    Each completed row is written and flushed as one line, so a run that is interrupted keeps a record of every row it
+    finished. Rows with a confirmed outcome can be skipped when the run is resumed.
+    """
+
+    def __init__(self, journal_file_path: str, resume: bool = False):
+        """
+        :param journal_file_path: The path of the journal file.
+        :param resume: A boolean indicating whether to load and append to an existing journal instead of starting a new
+            one.
+        """
+        self.journal_file_path = journal_file_path
+        self._confirmed = {}
+        if resume and os.path.isfile(journal_file_path):
+            self._load()
+        self._file = open(journal_file_path, "a" if resume else "w", encoding="utf-8")
+
+    @staticmethod
+    def _key(source, destination) -> tuple:
+        return str(source), os.path.normcase(os.path.normpath(str(destination)))
+
+    def _load(self):
+        with open(self.journal_file_path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line can be cut off if the previous run was interrupted while writing it
+                    continue
+                # Older journals can hold rows a resumed run skipped - They don't change what was confirmed
+                if entry["outcome"] == CMSUploadOutcomes.RESUMED.value:
+                    continue
+                key = self._key(entry["source"], entry["destination"])
+                if entry["outcome"] in CMSUploadOutcomes.get_confirmed_values():
+                    self._confirmed[key] = entry["outcome"]
+                else:
+                    self._confirmed.pop(key, None)
+
+    def confirmed_outcome(self, source, destination) -> str or None:
+        """
+        Get the confirmed outcome of a row from a previous run.
+
+        :param source: The Source value of the row.
+        :param destination: The Destination value of the row.
+
+        :return: The CMSUploadOutcomes value recorded for the row, or None if it wasn't confirmed.
+        """
+        if source is None or destination is None:
+            return None
+        return self._confirmed.get(self._key(source, destination))
+
+    def record(self, row_number: int, row, outcome: str, error: str = None, copy_result=None):
+        """
+        Append the outcome of a row to the journal. Rows skipped because the journal already confirms them aren't
+        written again.
+
+        :param row_number: The row number in the Excel file.
+        :param row: The Submission, Source and Destination values of the row.
+        :param outcome: The CMSUploadOutcomes value of the row.
+        :param error: (Optional) The error message of the row.
+        :param copy_result: (Optional) The CopyResult of the row's copy.
+        """
+        if outcome == CMSUploadOutcomes.RESUMED.value:
+            return
+        entry = {"row": row_number, "submission": row[0], "source": row[1], "destination": row[2],
+                 "outcome": outcome, "error": error, "time": time.time()}
+        if copy_result is not None:
+            entry["bytes"] = copy_result.bytes_copied
+            entry["seconds"] = copy_result.seconds
+            entry["checksum"] = copy_result.checksum
+        self._file.write(json.dumps(entry, default=str) + "\n")
+        self._file.flush()
+        if row[1] is not None and row[2] is not None and outcome in CMSUploadOutcomes.get_confirmed_values():
+            self._confirmed[self._key(row[1], row[2])] = outcome
+
+    def close(self):
+        """
+        Close the journal file.
+        """
+        self._file.close()
+
+    @staticmethod
+    def journal_file_path_for(file_path: str) -> str:
+        """
+        Build the default journal path for a bulk upload Excel file.
+
+        :param file_path: The path of the Excel file.
+
+        :return: The path of the journal file next to the Excel file.
+        """
+        return os.path.splitext(file_path)[0] + "_journal.jsonl"
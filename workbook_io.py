@@ -0,0 +1,127 @@
+import csv
+import os
+from itertools import islice
+
+
+def read_header(ws) -> tuple:
+    """
+    Read the header row of a worksheet.
+
+    :param ws: The worksheet, which can be opened in read-only mode.
+
+    :return: A tuple of the header values.
+    """
+    return next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+
+
+def has_columns(header: tuple, columns: list) -> bool:
+    """
+    Check that a header row starts with the given submissions file columns.
+
+    :param header: The header values of the worksheet.
+    :param columns: The CMSSubmissionsFileExcelColumns members expected at the start of the header, in order.
+
+    :return: True if every column is present in order, False otherwise.
+    """
+    if len(header) < len(columns):
+        return False
+    for value, column in zip(header, columns):
+        if value is None or str(value).lower() != column.value.lower():
+            return False
+    return True
+
+
+def iter_rows(ws, max_col: int):
+    """
+    Stream the data rows of a worksheet, skipping the header.
+
+    :param ws: The worksheet, which can be opened in read-only mode.
+    :param max_col: The number of columns to read from each row.
+
+    :return: A generator of row value tuples padded to max_col values.
+    """
+    for row in ws.iter_rows(min_row=2, max_col=max_col, values_only=True):
+        yield tuple(row) + (None,) * (max_col - len(row))
+
+
+def iter_chunks(rows, size: int):
+    """
+    Split a stream of rows into lists of at most the given size.
+
+    :param rows: An iterable of rows.
+    :param size: The maximum number of rows in each chunk.
+
+    :return: A generator of row lists.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def results_file_path(file_path: str, extension: str = ".xlsx") -> str:
+    """
+    Build the path of the results side file for a submissions file.
+
+    :param file_path: The path of the submissions file.
+    :param extension: The extension of the results file, ".xlsx" or ".csv".
+
+    :return: The path of the results file next to the submissions file.
+    """
+    return os.path.splitext(file_path)[0] + "_results" + extension
+
+
+class ResultWriter:
+    """
+    Writes result rows to a write-only workbook or a CSV file, depending on the output file extension.
+
+    Rows are written as they are appended, so memory stays flat no matter how many rows there are.
+    """
+
+    def __init__(self, output_file_path: str, columns: list):
+        """
+        :param output_file_path: The path of the .xlsx or .csv file to write.
+        :param columns: The CMSSubmissionsFileExcelColumns members to write as the header row.
+        """
+        self.output_file_path = output_file_path
+        self._csv_file = None
+        self._wb = None
+        if output_file_path.lower().endswith(".csv"):
+            self._csv_file = open(output_file_path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._csv_file)
+            self._writer.writerow([column.value for column in columns])
+        else:
+            import openpyxl
+            self._wb = openpyxl.Workbook(write_only=True)
+            self._ws = self._wb.create_sheet()
+            self._ws.append([column.value for column in columns])
+
+    def append(self, row):
+        """
+        Write a result row.
+
+        :param row: The values of the row.
+        """
+        if self._csv_file is not None:
+            self._writer.writerow(["" if value is None else value for value in row])
+        else:
+            self._ws.append(list(row))
+
+    def close(self):
+        """
+        Finish writing the output file.
+        """
+        if self._csv_file is not None:
+            self._csv_file.close()
+        else:
+            self._wb.save(self.output_file_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+